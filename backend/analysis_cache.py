@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from rate_limiter import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that never change the document being served
+TRACKING_PARAMS = {'fbclid', 'gclid', 'mc_cid', 'mc_eid'}
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so equivalent links share a cache entry."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or 'https'
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path or '/'
+    # Fragments are never sent to the server
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+class AnalysisCache:
+    """Content-addressed cache of generate_qna results stored in Redis.
+
+    Two kinds of keys are kept:
+      analysis:url:<sha256(normalized url)>  -> validators and content hash
+      analysis:doc:<sha256(document bytes)>  -> the serialized analysis
+    so the same document reached through different URLs is analyzed once.
+    A sorted set of content hashes scored by last access bounds the number
+    of stored analyses, evicting the least recently used ones.
+    """
+
+    def __init__(self, limiter):
+        # Shares the rate limiter's Redis connection and circuit breaker
+        self.limiter = limiter
+        self.redis = limiter.redis
+        self.ttl = int(os.getenv('ANALYSIS_CACHE_TTL', 60 * 60 * 24 * 7))
+        self.max_entries = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', 5000))
+        self.max_entry_bytes = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRY_BYTES', 512 * 1024))
+        self.lru_key = "analysis:lru"
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        digest = hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+        return f"analysis:url:{digest}"
+
+    @staticmethod
+    def _doc_key(content_hash: str) -> str:
+        return f"analysis:doc:{content_hash}"
+
+    async def get_validators(self, url: str):
+        """Return the validators recorded for a URL, or None if unknown."""
+        if not self.limiter.redis_available():
+            return None
+        try:
+            entry = await self.redis.get(self._url_key(url))
+            return json.loads(entry) if entry else None
+        except Exception as e:
+            logger.error(f"Error reading analysis cache validators: {str(e)}")
+            self.limiter.record_redis_failure(e)
+            return None
+
+    async def get_by_content(self, content_hash: str):
+        """Return the cached analysis for a document hash, or None."""
+        if not self.limiter.redis_available():
+            return None
+        try:
+            doc_key = self._doc_key(content_hash)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(doc_key)
+                pipe.zadd(self.lru_key, {content_hash: time.time()}, xx=True)
+                result, _ = await pipe.execute()
+            if result:
+                logger.debug(f"Analysis cache hit for document {content_hash[:12]}")
+                return json.loads(result)
+            return None
+        except Exception as e:
+            logger.error(f"Error reading analysis cache: {str(e)}")
+            self.limiter.record_redis_failure(e)
+            return None
+
+    async def get(self, url: str):
+        """Return the cached analysis for a URL without contacting its server."""
+        validators = await self.get_validators(url)
+        if not validators:
+            return None
+        return await self.get_by_content(validators['content_hash'])
+
+    async def link(self, document):
+        """Record the URL and validators of a document whose analysis is cached."""
+        if not self.limiter.redis_available():
+            return
+        try:
+            entry = json.dumps({
+                "content_hash": document.content_hash,
+                "etag": document.etag,
+                "last_modified": document.last_modified
+            })
+            await self.redis.set(self._url_key(document.url), entry, ex=self.ttl)
+        except Exception as e:
+            logger.error(f"Error linking URL in analysis cache: {str(e)}")
+            self.limiter.record_redis_failure(e)
+
+    async def touch(self, url: str):
+        """Extend the lifetime of a URL entry after a successful revalidation."""
+        if not self.limiter.redis_available():
+            return
+        try:
+            await self.redis.expire(self._url_key(url), self.ttl)
+        except Exception as e:
+            logger.error(f"Error refreshing analysis cache entry: {str(e)}")
+            self.limiter.record_redis_failure(e)
+
+    async def store(self, document, result: dict):
+        """Cache an analysis under the document's content hash."""
+        if not self.limiter.redis_available():
+            return
+        try:
+            payload = json.dumps(result)
+            if len(payload) > self.max_entry_bytes:
+                logger.debug(f"Analysis for {document.url} too large to cache ({len(payload)} bytes)")
+                return
+
+            content_hash = document.content_hash
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(self._doc_key(content_hash), payload, ex=self.ttl)
+                pipe.zadd(self.lru_key, {content_hash: time.time()})
+                pipe.zcard(self.lru_key)
+                _, _, entries = await pipe.execute()
+            await self.link(document)
+
+            if entries > self.max_entries:
+                await self._evict(entries - self.max_entries)
+        except Exception as e:
+            logger.error(f"Error writing analysis cache: {str(e)}")
+            self.limiter.record_redis_failure(e)
+
+    async def _evict(self, count: int):
+        """Drop the least recently used analyses."""
+        evicted = await self.redis.zpopmin(self.lru_key, count)
+        if evicted:
+            await self.redis.delete(*(self._doc_key(content_hash) for content_hash, _ in evicted))
+            logger.debug(f"Evicted {len(evicted)} analyses from cache")
+
+
+analysis_cache = AnalysisCache(rate_limiter)
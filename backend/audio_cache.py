@@ -0,0 +1,245 @@
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+AUDIO_DIR = os.getenv("AUDIO_DIR", "audio")
+# Limits for the local store, 0 disables a limit
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+AUDIO_CACHE_MAX_FILES = int(os.getenv("AUDIO_CACHE_MAX_FILES", 2000))
+AUDIO_CACHE_MAX_AGE = int(os.getenv("AUDIO_CACHE_MAX_AGE", 7 * 24 * 3600))
+AUDIO_SWEEP_INTERVAL = int(os.getenv("AUDIO_SWEEP_INTERVAL", 600))
+# Partial files older than this are left over from failed synthesis
+PARTIAL_FILE_AGE = 3600
+
+
+def audio_key(text: str, voice: str, engine: str, fmt: str = "mp3") -> str:
+    """Content hash identifying the audio for a text and its voice settings."""
+    digest = hashlib.sha256()
+    for part in (fmt, engine, voice, text):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class AudioStore:
+    """Where cached audio files live.
+
+    Subclasses map a content key to a file the frontend can fetch. The local
+    store keeps files in the directory served under /audio; an object store
+    would upload them and return their object name instead.
+    """
+
+    name = "store"
+
+    def filename(self, key: str, fmt: str = "mp3") -> str:
+        return f"audio_{key}.{fmt}"
+
+    def get(self, key: str, fmt: str = "mp3"):
+        """Return the file name for key, or None if it is not cached."""
+        raise NotImplementedError
+
+    def put(self, key: str, source_path: str, fmt: str = "mp3") -> str:
+        """Move the finished file at source_path into the store."""
+        raise NotImplementedError
+
+    def delete(self, key: str, fmt: str = "mp3"):
+        raise NotImplementedError
+
+    def sweep(self):
+        """Drop expired entries and enforce the size limits."""
+
+
+class LocalAudioStore(AudioStore):
+    """Audio files on local disk, evicted least recently used first once the
+    directory holds more than max_bytes or max_files."""
+
+    def __init__(self, directory=AUDIO_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES,
+                 max_files=AUDIO_CACHE_MAX_FILES, max_age=AUDIO_CACHE_MAX_AGE):
+        self.name = f"local:{directory}"
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_age = max_age
+        # File name -> size, least recently used first
+        self._files = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def _load(self):
+        """Index the files already on disk, oldest access first."""
+        if self._files is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.startswith("audio_") and not entry.name.endswith(".part"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        self._files = OrderedDict((name, size) for _, name, size in entries)
+        self._bytes = sum(self._files.values())
+
+    def _remove(self, filename):
+        self._bytes -= self._files.pop(filename, 0)
+        try:
+            os.remove(self._path(filename))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        evicted = 0
+        while self._files and ((self.max_bytes and self._bytes > self.max_bytes) or
+                               (self.max_files and len(self._files) > self.max_files)):
+            self._remove(next(iter(self._files)))
+            evicted += 1
+        if evicted:
+            logger.info(f"Evicted {evicted} cached audio files")
+
+    def get(self, key, fmt="mp3"):
+        filename = self.filename(key, fmt)
+        with self._lock:
+            self._load()
+            if filename not in self._files:
+                return None
+            if not os.path.exists(self._path(filename)):
+                self._remove(filename)
+                return None
+            self._files.move_to_end(filename)
+        # The modification time records the last use across restarts
+        try:
+            os.utime(self._path(filename))
+        except OSError:
+            pass
+        return filename
+
+    def put(self, key, source_path, fmt="mp3"):
+        filename = self.filename(key, fmt)
+        with self._lock:
+            self._load()
+            os.replace(source_path, self._path(filename))
+            self._bytes -= self._files.pop(filename, 0)
+            self._files[filename] = os.path.getsize(self._path(filename))
+            self._bytes += self._files[filename]
+            self._evict()
+        return filename
+
+    def delete(self, key, fmt="mp3"):
+        with self._lock:
+            self._load()
+            self._remove(self.filename(key, fmt))
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            # Rebuild the index so files removed or added outside the cache are noticed
+            self._files = None
+            self._load()
+            if self.max_age:
+                for filename in [name for name in self._files
+                                 if now - os.path.getmtime(self._path(name)) > self.max_age]:
+                    self._remove(filename)
+            self._evict()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".part") and now - entry.stat().st_mtime > PARTIAL_FILE_AGE:
+                    os.remove(entry.path)
+
+
+class AudioCache:
+    """Content addressed audio: identical text and voice settings are only
+    synthesized once, and concurrent identical requests share one synthesis."""
+
+    def __init__(self, store: AudioStore = None, sweep_interval=AUDIO_SWEEP_INTERVAL):
+        self.store = store or LocalAudioStore()
+        self.sweep_interval = sweep_interval
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._sweeper = None
+        self.hits = 0
+        self.misses = 0
+
+    @contextlib.contextmanager
+    def _key_lock(self, key):
+        """Hold a lock per key so only one request synthesizes each file."""
+        with self._locks_lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def get(self, key: str, fmt: str = "mp3"):
+        try:
+            return self.store.get(key, fmt)
+        except Exception as e:
+            logger.error(f"Error reading audio cache: {str(e)}")
+            return None
+
+    def put(self, key: str, source_path: str, fmt: str = "mp3") -> str:
+        return self.store.put(key, source_path, fmt)
+
+    def get_or_create(self, key: str, synthesize, fmt: str = "mp3") -> str:
+        """Return the cached file for key, calling synthesize(path) to write
+        it first if needed. synthesize returns False on failure."""
+        filename = self.get(key, fmt)
+        if filename:
+            self.hits += 1
+            return filename
+        with self._key_lock(key):
+            # Another request may have produced it while we waited
+            filename = self.get(key, fmt)
+            if filename:
+                self.hits += 1
+                return filename
+            self.misses += 1
+            os.makedirs(AUDIO_DIR, exist_ok=True)
+            # Unique per call: the key lock does not reach other processes
+            partial_file = os.path.join(AUDIO_DIR, f"{key}.{uuid.uuid4().hex}.{fmt}.part")
+            try:
+                if not synthesize(partial_file):
+                    return None
+                return self.put(key, partial_file, fmt)
+            finally:
+                if os.path.exists(partial_file):
+                    os.remove(partial_file)
+
+    async def _sweep_periodically(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.store.sweep)
+            except Exception as e:
+                logger.error(f"Error sweeping audio cache: {str(e)}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def ensure_sweeper(self):
+        """Start the background sweeper on the running event loop."""
+        if self.sweep_interval and (self._sweeper is None or self._sweeper.done()):
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_periodically())
+
+    async def close(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._sweeper
+            self._sweeper = None
+
+
+audio_cache = AudioCache()
+
@@ -0,0 +1,186 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from rate_limiter import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# 'background' queues audio and returns a job id, 'inline' synthesizes it
+# before responding. Lambda freezes once a response is sent, so lambda.py
+# defaults to inline.
+AUDIO_JOB_MODE = os.getenv("AUDIO_JOB_MODE", "background")
+AUDIO_WORKERS = int(os.getenv("AUDIO_WORKERS", 2))
+# How long finished jobs are remembered for status polling
+AUDIO_JOB_TTL = int(os.getenv("AUDIO_JOB_TTL", 3600))
+MAX_AUDIO_JOBS = int(os.getenv("MAX_AUDIO_JOBS", 1000))
+# Shared records of unfinished jobs expire in case their worker dies
+AUDIO_JOB_PENDING_TTL = int(os.getenv("AUDIO_JOB_PENDING_TTL", 600))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class AudioJob:
+    def __init__(self, job_id: str, text: str):
+        self.id = job_id
+        self.text = text
+        self.status = QUEUED
+        self.audio_file = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+
+    def update(self, status: str, audio_file: str = None, error: str = None):
+        self.status = status
+        self.audio_file = audio_file
+        self.error = error
+        self.updated = time.time()
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        job = cls(data["jobId"], None)
+        job.update(data["status"], data.get("audio_file"), data.get("error"))
+        return job
+
+    def to_dict(self) -> dict:
+        job = {"jobId": self.id, "status": self.status,
+               "statusUrl": f"/api/audio-jobs/{self.id}"}
+        if self.audio_file:
+            job["audio_file"] = self.audio_file
+            job["audioUrl"] = f"/api/audio/{self.audio_file}"
+        if self.error:
+            job["error"] = self.error
+        return job
+
+
+class AudioJobQueue:
+    """Runs audio synthesis in the background on a small pool of workers.
+
+    Job ids are the content keys of the audio, so the same narration queued
+    twice is one job, and a job whose record has expired can still be
+    reported as done from the audio cache. Job records are also written to
+    Redis so that any worker process can answer a status poll, and a job
+    queued by one process is not queued again by another.
+    """
+
+    def __init__(self, limiter=None, workers: int = AUDIO_WORKERS,
+                 ttl: int = AUDIO_JOB_TTL, max_jobs: int = MAX_AUDIO_JOBS):
+        # Shares the rate limiter's Redis connection and circuit breaker;
+        # without one, jobs are only known to this process
+        self.limiter = limiter
+        self.redis = limiter.redis if limiter else None
+        self.workers = workers
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self._queue = None
+        self._tasks = []
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"audio:job:{job_id}"
+
+    def _shared(self) -> bool:
+        return self.limiter is not None and self.limiter.redis_available()
+
+    async def _save(self, job: AudioJob):
+        """Share a job's state with the other worker processes."""
+        if not self._shared():
+            return
+        ttl = self.ttl if job.status in (DONE, FAILED) else AUDIO_JOB_PENDING_TTL
+        try:
+            await self.redis.set(self._key(job.id), json.dumps(job.to_dict()), ex=ttl)
+        except Exception as e:
+            logger.error(f"Error saving audio job {job.id}: {str(e)}")
+            self.limiter.record_redis_failure(e)
+
+    async def _load(self, job_id: str):
+        if not self._shared():
+            return None
+        try:
+            data = await self.redis.get(self._key(job_id))
+            return AudioJob.from_dict(json.loads(data)) if data else None
+        except Exception as e:
+            logger.error(f"Error reading audio job {job_id}: {str(e)}")
+            self.limiter.record_redis_failure(e)
+            return None
+
+    def _ensure_workers(self):
+        self._tasks = [task for task in self._tasks if not task.done()]
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        while len(self._tasks) < self.workers:
+            self._tasks.append(loop.create_task(self._work()))
+
+    def _prune(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.status in (DONE, FAILED) and now - job.updated > self.ttl]:
+            del self.jobs[job_id]
+        while len(self.jobs) > self.max_jobs:
+            oldest = next(iter(self.jobs))
+            if self.jobs[oldest].status in (QUEUED, RUNNING):
+                break
+            del self.jobs[oldest]
+
+    async def _work(self):
+        while True:
+            job, synthesize = await self._queue.get()
+            try:
+                job.update(RUNNING)
+                await self._save(job)
+                audio = await asyncio.to_thread(synthesize, job.text)
+                job.update(DONE, audio_file=audio["audio_file"])
+                logger.info(f"Audio job {job.id} done")
+            except Exception as e:
+                logger.error(f"Audio job {job.id} failed: {str(e)}")
+                job.update(FAILED, error=str(getattr(e, 'detail', e)))
+            try:
+                await self._save(job)
+            finally:
+                # The text is no longer needed once the job has run
+                job.text = None
+                self._queue.task_done()
+
+    async def submit(self, job_id: str, text: str, synthesize) -> AudioJob:
+        """Queue synthesize(text) unless job_id is already queued or running
+        in any worker.
+
+        Callers only submit audio that is not in the audio cache, so a job
+        that finished earlier is run again: its file may have been evicted.
+        synthesize runs in a worker thread and returns a dict with the
+        audio_file it produced.
+        """
+        self._prune()
+        job = self.jobs.get(job_id) or await self._load(job_id)
+        if job and job.status in (QUEUED, RUNNING):
+            return job
+        job = AudioJob(job_id, text)
+        self.jobs[job_id] = job
+        # Shared before a worker can pick it up and mark it running
+        await self._save(job)
+        self._ensure_workers()
+        await self._queue.put((job, synthesize))
+        logger.info(f"Queued audio job {job_id} ({self._queue.qsize()} waiting)")
+        return job
+
+    async def get(self, job_id: str):
+        """The job from this process, or from the worker that queued it."""
+        self._prune()
+        return self.jobs.get(job_id) or await self._load(job_id)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+
+
+audio_jobs = AudioJobQueue(rate_limiter)
@@ -0,0 +1,197 @@
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_loaded = False
+
+# Markdown style headings ("## Methods") or numbered section titles
+# ("3.2 Results") that start a new chunk when possible
+HEADING_RE = re.compile(r'^(#{1,6}\s+\S.*|\d+(\.\d+)*\.?\s+[A-Z][^.!?]{0,80})$')
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+(?=["\'(\[]?[A-Z0-9])')
+PARAGRAPH_RE = re.compile(r'\n\s*\n')
+
+
+def get_encoding():
+    """The tiktoken encoding, loaded on first use, or None if unavailable."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # Fall back to the character heuristic when tiktoken (or its
+            # encoding files) are unavailable
+            logger.warning(f"tiktoken unavailable, estimating token counts: {str(e)}")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken, or estimate ~4 characters per token."""
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens."""
+    encoding = get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def split_sentences(text: str) -> list:
+    """Split text into sentences on terminal punctuation."""
+    return [sentence for sentence in SENTENCE_RE.split(text.strip()) if sentence]
+
+
+class Chunk:
+    """A piece of a document sized to fit a model's context."""
+
+    def __init__(self, index, text, tokens, page=None):
+        self.index = index
+        self.text = text
+        self.tokens = tokens
+        self.page = page
+
+    def to_dict(self):
+        return {"index": self.index, "text": self.text,
+                "tokens": self.tokens, "page": self.page}
+
+    def __repr__(self):
+        return f"Chunk(index={self.index}, tokens={self.tokens}, page={self.page})"
+
+
+def _split_words(text, max_tokens, count):
+    """Split an oversized sentence into runs of words under the budget."""
+    units = []
+    words = []
+    tokens = 0
+    for word in text.split():
+        word_tokens = count(word) + 1
+        if words and tokens + word_tokens > max_tokens:
+            units.append((' '.join(words), tokens, False))
+            words, tokens = [], 0
+        words.append(word)
+        tokens += word_tokens
+    if words:
+        units.append((' '.join(words), tokens, False))
+    return units
+
+
+def _tail(text, max_tokens, count):
+    """The trailing sentences of text that fit the budget, or its trailing
+    words if not even the last sentence fits, as (text, tokens)."""
+    sentences = []
+    tokens = 0
+    for sentence in reversed(split_sentences(text)):
+        sentence_tokens = count(sentence) + 1
+        if tokens + sentence_tokens > max_tokens:
+            break
+        sentences.append(sentence)
+        tokens += sentence_tokens
+    if sentences:
+        return ' '.join(reversed(sentences)), tokens
+    words = []
+    for word in reversed(text.split()):
+        word_tokens = count(word) + 1
+        if tokens + word_tokens > max_tokens:
+            break
+        words.append(word)
+        tokens += word_tokens
+    return ' '.join(reversed(words)), tokens
+
+
+def _units(text, max_tokens, count):
+    """Break text into (text, tokens, is_heading) units that each fit the
+    budget, preferring paragraph, then sentence, then word boundaries."""
+    for paragraph in PARAGRAPH_RE.split(text):
+        paragraph = ' '.join(paragraph.split())
+        if not paragraph:
+            continue
+        tokens = count(paragraph)
+        if tokens <= max_tokens:
+            yield paragraph, tokens, bool(HEADING_RE.match(paragraph))
+            continue
+        for sentence in split_sentences(paragraph):
+            tokens = count(sentence)
+            if tokens <= max_tokens:
+                yield sentence, tokens, False
+            else:
+                yield from _split_words(sentence, max_tokens, count)
+
+
+def chunk_text(text: str, max_tokens: int = 1000, overlap_tokens: int = 0,
+               count=count_tokens, page=None, start_index: int = 0) -> list:
+    """Split text into chunks of at most max_tokens tokens.
+
+    Chunks break at paragraph boundaries where possible, start a new chunk
+    at headings once the current chunk is reasonably full, and repeat up to
+    overlap_tokens of trailing text at the start of the next chunk, cutting
+    a unit that does not fit whole at a sentence or word boundary. Every
+    unit of text is counted once, so chunking is linear in the input size.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    # Whether current holds text that is not just overlap from the last chunk
+    fresh = False
+
+    def flush():
+        nonlocal current, current_tokens, fresh
+        chunks.append(Chunk(start_index + len(chunks),
+                            '\n\n'.join(unit for unit, _ in current),
+                            current_tokens, page))
+        # Carry trailing units into the next chunk as overlap, and the end
+        # of the first unit that does not fit whole
+        carried = []
+        carried_tokens = 0
+        for unit, tokens in reversed(current):
+            if carried_tokens + tokens > overlap_tokens:
+                unit, tokens = _tail(unit, overlap_tokens - carried_tokens, count)
+                if unit:
+                    carried.append((unit, tokens))
+                    carried_tokens += tokens
+                break
+            carried.append((unit, tokens))
+            carried_tokens += tokens
+        carried.reverse()
+        current, current_tokens, fresh = carried, carried_tokens, False
+
+    for unit, tokens, is_heading in _units(text, max_tokens, count):
+        starts_section = is_heading and current_tokens >= max_tokens // 4
+        if fresh and (starts_section or current_tokens + tokens > max_tokens):
+            flush()
+        if is_heading and not fresh:
+            # Overlap from the previous section is noise before a heading
+            current, current_tokens = [], 0
+        # Drop overlap that would push this unit over the budget
+        while current and current_tokens + tokens > max_tokens:
+            current_tokens -= current.pop(0)[1]
+        current.append((unit, tokens))
+        current_tokens += tokens
+        fresh = True
+
+    if fresh:
+        flush()
+    return chunks
+
+
+def chunk_pages(pages, max_tokens: int = 1000, overlap_tokens: int = 0,
+                count=count_tokens) -> list:
+    """Chunk each page separately so every chunk keeps its page number."""
+    chunks = []
+    for page_num, page_text in enumerate(pages, 1):
+        chunks.extend(chunk_text(page_text, max_tokens, overlap_tokens, count,
+                                 page=page_num, start_index=len(chunks)))
+    return chunks
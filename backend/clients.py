@@ -0,0 +1,151 @@
+import asyncio
+import inspect
+import logging
+import os
+import threading
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Connection pool limits shared by every outbound HTTP client
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 60))
+POLLY_MAX_POOL_CONNECTIONS = int(os.getenv("POLLY_MAX_POOL_CONNECTIONS", 20))
+# Total Polly attempts per request, including the first. This is the only
+# retry layer; adaptive mode also slows the client down while throttled.
+POLLY_MAX_ATTEMPTS = int(os.getenv("POLLY_MAX_ATTEMPTS", 4))
+
+_lock = threading.Lock()
+_clients = {}
+# Async clients hold connections bound to the event loop that opened them,
+# so each is stored with its loop and replaced when used from another one
+_async_clients = {}
+
+
+def _http2_enabled():
+    if os.getenv("HTTP2", "true").lower() in ("0", "false", "no"):
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _limits():
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+
+
+def _get(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+                logger.debug(f"Created shared {name} client")
+    return client
+
+
+async def _close_async(name, client):
+    try:
+        close = getattr(client, "aclose", None) or getattr(client, "close")
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logger.error(f"Error closing async {name} client: {str(e)}")
+
+
+def _retire_async(name, loop, client):
+    """Close an async client whose event loop is no longer the one in use."""
+    if loop.is_closed():
+        # Its connections can only be closed on their own loop; they are
+        # released once the client is garbage collected
+        logger.warning(f"Dropped async {name} client of a closed event loop")
+        return
+    # Runs on the old loop, now if another thread is running it or else
+    # the next time it runs
+    asyncio.run_coroutine_threadsafe(_close_async(name, client), loop)
+
+
+def _get_async(name, factory):
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(name)
+    if entry is None or entry[0] is not loop:
+        if entry is not None:
+            _retire_async(name, *entry)
+        entry = (loop, factory())
+        _async_clients[name] = entry
+        logger.debug(f"Created shared async {name} client")
+    return entry[1]
+
+
+def get_http_client() -> httpx.Client:
+    """Pooled synchronous HTTP client."""
+    return _get("http", lambda: httpx.Client(
+        follow_redirects=True, http2=_http2_enabled(),
+        limits=_limits(), timeout=HTTP_TIMEOUT))
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Pooled asynchronous HTTP client for the running event loop."""
+    return _get_async("http", lambda: httpx.AsyncClient(
+        follow_redirects=True, http2=_http2_enabled(),
+        limits=_limits(), timeout=HTTP_TIMEOUT))
+
+
+def get_async_genai_client():
+    """Async Gemini client for the running event loop."""
+    from google import genai
+    return _get_async("genai", lambda: genai.Client().aio)
+
+
+def get_openai_client():
+    import openai
+    return _get("openai", lambda: openai.OpenAI(
+        http_client=httpx.Client(http2=_http2_enabled(), limits=_limits(),
+                                 timeout=HTTP_TIMEOUT)))
+
+
+def get_async_openai_client():
+    import openai
+    return _get_async("openai", lambda: openai.AsyncOpenAI(
+        http_client=httpx.AsyncClient(http2=_http2_enabled(), limits=_limits(),
+                                      timeout=HTTP_TIMEOUT)))
+
+
+def get_polly_client():
+    """Shared Polly client. boto3 clients are thread-safe, so one client with a
+    large enough pool serves all concurrent synthesis threads."""
+    import boto3
+    from botocore.config import Config
+    return _get("polly", lambda: boto3.client('polly', config=Config(
+        max_pool_connections=POLLY_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={'mode': 'adaptive', 'max_attempts': POLLY_MAX_ATTEMPTS})))
+
+
+async def close_clients():
+    """Close pooled connections on shutdown."""
+    for name, (loop, client) in list(_async_clients.items()):
+        if loop is asyncio.get_running_loop():
+            await _close_async(name, client)
+        else:
+            _retire_async(name, loop, client)
+    _async_clients.clear()
+
+    with _lock:
+        for name, client in list(_clients.items()):
+            try:
+                if hasattr(client, "close"):
+                    client.close()
+            except Exception as e:
+                logger.error(f"Error closing {name} client: {str(e)}")
+        _clients.clear()
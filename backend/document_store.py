@@ -0,0 +1,188 @@
+import json
+import logging
+import mmap
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+from chunker import Chunk
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 1
+
+
+class StoredChunks:
+    """Read-only sequence of chunks backed by memory-mapped columns.
+
+    Chunk text lives in one UTF-8 blob addressed by an offsets column, so a
+    chunk is only decoded when it is accessed (e.g. when it is a search hit).
+    """
+
+    def __init__(self, text_path, offsets, pages, tokens):
+        self._offsets = offsets
+        self._pages = pages
+        self._tokens = tokens
+        if os.path.getsize(text_path) > 0:
+            with open(text_path, 'rb') as f:
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._text = b""
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        page = int(self._pages[i])
+        return Chunk(i, self._text[start:end].decode('utf-8'),
+                     int(self._tokens[i]), page or None)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class DocumentStore:
+    """On-disk store of chunked and embedded documents keyed by content hash.
+
+    Each document is a directory of columns:
+      meta.json       url, title, embedder and shapes
+      text.bin        chunk texts concatenated as UTF-8
+      offsets.npy     int64 byte offsets into text.bin (n + 1)
+      pages.npy       int32 page number of each chunk (0 when unknown)
+      tokens.npy      int32 token count of each chunk
+      embeddings.npy  float16/float32 matrix of normalized embeddings
+    The .npy columns are memory-mapped on load so a warm process answers
+    retrieval queries without parsing or copying anything.
+    """
+
+    def __init__(self, root, dtype="float16", max_bytes=None):
+        self.root = root
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = max_bytes
+
+    def _path(self, content_hash):
+        return os.path.join(self.root, content_hash[:2], content_hash)
+
+    def exists(self, content_hash):
+        return os.path.exists(os.path.join(self._path(content_hash), "meta.json"))
+
+    def _meta(self, content_hash):
+        try:
+            with open(os.path.join(self._path(content_hash), "meta.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, content_hash, chunks, vectors, embedder_name, url="", title=""):
+        """Write a document's chunks and embeddings atomically, replacing an
+        entry written by another embedder or store version."""
+        path = self._path(content_hash)
+        meta = self._meta(content_hash)
+        if meta and meta.get("version") == STORE_VERSION and meta.get("embedder") == embedder_name:
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        os.makedirs(tmp_path)
+        try:
+            encoded = [chunk.text.encode('utf-8') for chunk in chunks]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(text) for text in encoded], out=offsets[1:])
+            with open(os.path.join(tmp_path, "text.bin"), 'wb') as f:
+                f.writelines(encoded)
+            np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+            np.save(os.path.join(tmp_path, "pages.npy"),
+                    np.array([chunk.page or 0 for chunk in chunks], dtype=np.int32))
+            np.save(os.path.join(tmp_path, "tokens.npy"),
+                    np.array([chunk.tokens for chunk in chunks], dtype=np.int32))
+            np.save(os.path.join(tmp_path, "embeddings.npy"),
+                    np.asarray(vectors).astype(self.dtype, copy=False))
+            # meta.json is written last, its presence marks a complete entry
+            with open(os.path.join(tmp_path, "meta.json"), 'w') as f:
+                json.dump({
+                    "version": STORE_VERSION,
+                    "url": url,
+                    "title": title,
+                    "embedder": embedder_name,
+                    "count": len(chunks),
+                    "dim": int(np.asarray(vectors).shape[1]) if len(chunks) else 0,
+                    "dtype": self.dtype.name
+                }, f)
+            stale_path = None
+            if os.path.exists(path):
+                # Move the outdated entry aside; readers keep their mappings
+                stale_path = f"{path}.tmp-{uuid.uuid4().hex}"
+                try:
+                    os.rename(path, stale_path)
+                except OSError:
+                    stale_path = None
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Another worker stored the same document first
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            if stale_path:
+                shutil.rmtree(stale_path, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        if self.max_bytes:
+            self.prune()
+        return path
+
+    def load(self, content_hash):
+        """Return (metadata, chunks, vectors) with memory-mapped columns, or
+        None if the document is not stored."""
+        path = self._path(content_hash)
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        if meta.get("version") != STORE_VERSION:
+            return None
+
+        # Touch the entry so pruning evicts the least recently used documents
+        os.utime(path)
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode='r')
+        pages = np.load(os.path.join(path, "pages.npy"), mmap_mode='r')
+        tokens = np.load(os.path.join(path, "tokens.npy"), mmap_mode='r')
+        vectors = np.load(os.path.join(path, "embeddings.npy"), mmap_mode='r')
+        chunks = StoredChunks(os.path.join(path, "text.bin"), offsets, pages, tokens)
+        return meta, chunks, vectors
+
+    def prune(self):
+        """Delete least recently used documents until under max_bytes."""
+        entries = []
+        total = 0
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.is_dir() or '.tmp-' in entry.name:
+                    continue
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+                total += size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            logger.debug(f"Pruned stored document {os.path.basename(path)}")
+
+
+document_store = DocumentStore(
+    os.getenv("DOCUMENT_STORE_DIR", "/tmp/document_store"),
+    dtype=os.getenv("DOCUMENT_STORE_DTYPE", "float16"),
+    max_bytes=int(os.getenv("DOCUMENT_STORE_MAX_BYTES", 256 * 1024 * 1024))
+)
@@ -1,10 +1,18 @@
-import firebase_admin
-from firebase_admin import credentials, auth
 from fastapi import HTTPException, Request
+from jose import jwt, JWTError, ExpiredSignatureError
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
 import os
+import re
+import sys
+import threading
+import time
 import logging
 import traceback
-import boto3
+
+from clients import get_async_http_client
 
 # Set up logging with more detailed format
 logging.basicConfig(
@@ -14,9 +22,185 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Verified tokens are cached until they expire. With revocation checks
+# enabled an entry is trusted for at most TOKEN_REVOCATION_INTERVAL seconds.
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+CHECK_REVOKED = os.getenv('FIREBASE_CHECK_REVOKED', 'false').lower() in ('1', 'true', 'yes')
+TOKEN_REVOCATION_INTERVAL = float(os.getenv('TOKEN_REVOCATION_INTERVAL', 300))
+
+
+class TokenCache:
+    """LRU cache of decoded ID token claims keyed by a hash of the token."""
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        claims, expires = entry
+        if expires <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return claims
+
+    def set(self, token: str, claims: dict, max_age: float = None):
+        expires = float(claims.get('exp', 0))
+        if max_age is not None:
+            expires = min(expires, time.time() + max_age)
+        if expires <= time.time():
+            return
+        key = self._key(token)
+        self._entries[key] = (claims, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+# ID tokens are verified locally against Google's published signing keys.
+# FIREBASE_JWKS_FILE points at a local key set instead (a JWKS document or a
+# {kid: PEM certificate} map), e.g. to run offline with self-signed tokens.
+# FIREBASE_TOKEN_VERIFIER=sdk uses the Admin SDK instead.
+TOKEN_VERIFIER = os.getenv('FIREBASE_TOKEN_VERIFIER', 'local')
+FIREBASE_JWKS_URL = os.getenv(
+    'FIREBASE_JWKS_URL',
+    'https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com')
+FIREBASE_JWKS_FILE = os.getenv('FIREBASE_JWKS_FILE')
+# Refresh this long before the keys expire, while still serving the old ones
+KEY_REFRESH_MARGIN = 300
+KEY_RETRY_INTERVAL = 30
+# Leeway for iat, auth_time and exp, like the Admin SDK's clock_skew_seconds (0-60)
+TOKEN_CLOCK_SKEW = min(max(int(os.getenv('TOKEN_CLOCK_SKEW', 0)), 0), 60)
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+class PublicKeySet:
+    """Token signing keys, cached for as long as Cache-Control allows.
+
+    Keys are refreshed in the background shortly before they expire, so
+    requests only wait for a fetch on a cold start or when a token is signed
+    with a key that has not been seen yet.
+    """
+
+    def __init__(self, url: str = FIREBASE_JWKS_URL, path: str = FIREBASE_JWKS_FILE):
+        self.url = url
+        self.path = path
+        self._keys = {}
+        self._expires = 0.0
+        self._fetched = 0.0
+        self._mtime = None
+        self._refresh_task = None
+
+    @staticmethod
+    def _parse(data: dict) -> dict:
+        if 'keys' in data:
+            return {key['kid']: key for key in data['keys']}
+        return dict(data)
+
+    def _load_file(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime != self._mtime:
+            with open(self.path) as f:
+                self._keys = self._parse(json.load(f))
+            self._mtime = mtime
+            logger.info(f"Loaded {len(self._keys)} token signing keys from {self.path}")
+
+    async def _fetch(self):
+        try:
+            response = await get_async_http_client().get(self.url)
+            response.raise_for_status()
+            self._keys = self._parse(response.json())
+            match = MAX_AGE_RE.search(response.headers.get('cache-control', ''))
+            self._expires = time.time() + (int(match.group(1)) if match else 3600)
+            logger.debug(f"Fetched {len(self._keys)} token signing keys")
+        except Exception as e:
+            # Keep serving the keys we have and try again shortly
+            logger.error(f"Error fetching token signing keys: {str(e)}")
+            self._expires = time.time() + KEY_RETRY_INTERVAL
+        finally:
+            self._fetched = time.time()
+
+    def _refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._fetch())
+        return self._refresh_task
+
+    async def get_key(self, kid: str):
+        """Return the key with the given id, or None if it is unknown."""
+        if self.path:
+            self._load_file()
+            return self._keys.get(kid)
+
+        now = time.time()
+        if not self._keys or now >= self._expires:
+            await asyncio.shield(self._refresh())
+        elif now >= self._expires - KEY_REFRESH_MARGIN:
+            self._refresh()
+
+        key = self._keys.get(kid)
+        if key is None and time.time() - self._fetched > KEY_RETRY_INTERVAL:
+            # Keys may have been rotated since the last fetch
+            await asyncio.shield(self._refresh())
+            key = self._keys.get(kid)
+        return key
+
+
+public_keys = PublicKeySet()
+
+
+_project_id = os.getenv('FIREBASE_PROJECT_ID') or os.getenv('GOOGLE_CLOUD_PROJECT')
+
+
+def get_project_id():
+    """The Firebase project ID that ID tokens must be issued for."""
+    global _project_id
+    if not _project_id and ensure_firebase():
+        import firebase_admin
+        _project_id = firebase_admin.get_app().project_id
+    return _project_id
+
+
+async def verify_id_token_locally(token: str, project_id: str) -> dict:
+    """Verify a Firebase ID token's signature and claims without the SDK."""
+    header = jwt.get_unverified_header(token)
+    if header.get('alg') != 'RS256':
+        raise JWTError("Unexpected token algorithm")
+    key = await public_keys.get_key(header.get('kid'))
+    if key is None:
+        raise JWTError("Unknown token signing key")
+
+    claims = jwt.decode(token, key, algorithms=['RS256'], audience=project_id,
+                        issuer=f"https://securetoken.google.com/{project_id}",
+                        options={'leeway': TOKEN_CLOCK_SKEW})
+    subject = claims.get('sub')
+    if not isinstance(subject, str) or not subject or len(subject) > 128:
+        raise JWTError("Invalid token subject")
+    latest = time.time() + TOKEN_CLOCK_SKEW
+    for claim in ('iat', 'auth_time'):
+        value = claims.get(claim)
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise JWTError(f"Token has no valid {claim}")
+        if value > latest:
+            raise JWTError(f"Token {claim} is in the future")
+    claims['uid'] = subject
+    return claims
+
+
 def get_secret(secret_name):
     """Retrieve a secret from AWS Secrets Manager"""
     try:
+        import boto3
+
         # Create a Secrets Manager client
         session = boto3.session.Session()
         client = session.client(
@@ -41,6 +225,9 @@ def get_secret(secret_name):
 
 def init_firebase():
     """Initialize Firebase Admin SDK with credentials from AWS Secrets Manager"""
+    import firebase_admin
+    from firebase_admin import credentials
+
     try:
         # Check if Firebase is already initialized
         if firebase_admin._apps:
@@ -55,18 +242,11 @@ def init_firebase():
             logger.info(f"Retrieving Firebase credentials from AWS Secrets Manager: {secret_name}")
             firebase_creds_json = get_secret(secret_name)
             
-            # Create temporary file for credentials
-            cred_path = "/tmp/firebase-adminsdk.json"
-            with open(cred_path, 'w') as f:
-                f.write(firebase_creds_json)
-            
-            # Initialize Firebase with credentials
-            cred = credentials.Certificate(cred_path)
+            # Initialize Firebase with credentials, parsed in memory rather
+            # than written to a temporary file
+            cred = credentials.Certificate(json.loads(firebase_creds_json))
             firebase_admin.initialize_app(cred)
             
-            # Remove temporary file for security
-            os.remove(cred_path)
-            
             logger.info("Firebase successfully initialized from Secrets Manager")
             
         except Exception as secrets_error:
@@ -77,18 +257,10 @@ def init_firebase():
             if firebase_creds_env:
                 logger.info("Falling back to environment variable for Firebase credentials")
                 
-                # Create temporary file for credentials
-                cred_path = "/tmp/firebase-adminsdk.json"
-                with open(cred_path, 'w') as f:
-                    f.write(firebase_creds_env)
-                
                 # Initialize Firebase with credentials
-                cred = credentials.Certificate(cred_path)
+                cred = credentials.Certificate(json.loads(firebase_creds_env))
                 firebase_admin.initialize_app(cred)
                 
-                # Remove temporary file for security
-                os.remove(cred_path)
-                
                 logger.info("Firebase successfully initialized from environment variable")
                 return
             
@@ -100,6 +272,57 @@ def init_firebase():
         raise
 
 
+# Firebase is initialized on first use rather than at import, so cold starts
+# and requests that never need the Admin SDK skip the secret fetch
+_firebase_lock = threading.Lock()
+_firebase_failed_at = None
+FIREBASE_INIT_RETRY = 60
+
+
+def firebase_initialized() -> bool:
+    firebase_admin = sys.modules.get('firebase_admin')
+    return bool(firebase_admin and firebase_admin._apps)
+
+
+def ensure_firebase() -> bool:
+    """Initialize Firebase once, returning whether it is available."""
+    global _firebase_failed_at
+    if firebase_initialized():
+        return True
+    with _firebase_lock:
+        if firebase_initialized():
+            return True
+        if _firebase_failed_at and time.time() - _firebase_failed_at < FIREBASE_INIT_RETRY:
+            return False
+        try:
+            init_firebase()
+            return True
+        except Exception as e:
+            logger.error(f"Firebase initialization failed: {str(e)}")
+            _firebase_failed_at = time.time()
+            return False
+
+
+class RevokedTokenError(JWTError):
+    """The ID token has been revoked."""
+
+
+def verify_id_token_with_sdk(token: str) -> dict:
+    """Verify a token with the Admin SDK, raising the same errors as local
+    verification."""
+    if not ensure_firebase():
+        raise RuntimeError("Firebase is not initialized")
+    from firebase_admin import auth
+    try:
+        return auth.verify_id_token(token, check_revoked=CHECK_REVOKED)
+    except auth.ExpiredIdTokenError as e:
+        raise ExpiredSignatureError(str(e))
+    except auth.RevokedIdTokenError as e:
+        raise RevokedTokenError(str(e))
+    except auth.InvalidIdTokenError as e:
+        raise JWTError(str(e))
+
+
 async def verify_firebase_token(request: Request):
     token = request.headers.get('Authorization', '').replace('Bearer ', '')
     
@@ -111,9 +334,22 @@ async def verify_firebase_token(request: Request):
         logger.warning("No token provided in Authorization header")
         raise HTTPException(status_code=401, detail='No token provided')
 
+    decoded_token = token_cache.get(token)
+    if decoded_token is not None:
+        request.state.user_id = decoded_token['uid']
+        return decoded_token
+
     try:
         logger.debug(f"Verifying token: {token[:10]}...")
-        decoded_token = auth.verify_id_token(token)
+        project_id = _project_id or await asyncio.to_thread(get_project_id)
+        if TOKEN_VERIFIER == 'local' and project_id and not CHECK_REVOKED:
+            decoded_token = await verify_id_token_locally(token, project_id)
+        else:
+            # Revocation checks need the Admin SDK. Signature checks and
+            # certificate fetches block, keep them off the loop.
+            decoded_token = await asyncio.to_thread(verify_id_token_with_sdk, token)
+        token_cache.set(token, decoded_token,
+                        TOKEN_REVOCATION_INTERVAL if CHECK_REVOKED else None)
         
         # Set user_id on request state for later use
         request.state.user_id = decoded_token['uid']
@@ -121,16 +357,16 @@ async def verify_firebase_token(request: Request):
         logger.debug(f"Token verified successfully for user: {decoded_token['uid']}")
         return decoded_token
     
-    except auth.ExpiredIdTokenError:
+    except ExpiredSignatureError:
         logger.warning("Token expired")
         raise HTTPException(status_code=401, detail='Token expired')
     
-    except auth.RevokedIdTokenError:
+    except RevokedTokenError:
         logger.warning("Token revoked")
         raise HTTPException(status_code=401, detail='Token revoked')
     
-    except auth.InvalidIdTokenError:
-        logger.warning("Invalid token")
+    except JWTError as e:
+        logger.warning(f"Invalid token: {str(e)}")
         raise HTTPException(status_code=401, detail='Invalid token')
     
     except Exception as e:
@@ -0,0 +1,60 @@
+import builtins
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Set IMPORT_PROFILE=1 to log which modules dominate a cold start
+IMPORT_PROFILE = os.getenv('IMPORT_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+
+def report(timings: dict, top: int = 25):
+    """Log the slowest imports by cumulative time."""
+    total = sum(cumulative for cumulative, _, depth in timings.values() if depth == 0)
+    logger.info(f"Imported {len(timings)} modules in {total * 1000:.0f}ms")
+    slowest = sorted(timings.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    for name, (cumulative, own, _) in slowest:
+        logger.info(f"  {cumulative * 1000:8.1f}ms  (self {own * 1000:7.1f}ms)  {name}")
+
+
+@contextmanager
+def profile_imports(enabled: bool = IMPORT_PROFILE, top: int = 25):
+    """Time every module first imported inside the block.
+
+    Each module gets its cumulative time (including the modules it imports)
+    and its own time, like python -X importtime but aggregated and logged
+    so it shows up in CloudWatch.
+    """
+    if not enabled:
+        yield None
+        return
+
+    timings = {}
+    # Time spent in nested imports of each import in progress
+    children = []
+    original_import = builtins.__import__
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return original_import(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        children.append(0.0)
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = children.pop()
+            if children:
+                children[-1] += elapsed
+            if name not in timings:
+                timings[name] = (elapsed, elapsed - nested, len(children))
+
+    builtins.__import__ = timed_import
+    try:
+        yield timings
+    finally:
+        builtins.__import__ = original_import
+        report(timings, top)
@@ -5,9 +5,14 @@ from mangum import Mangum
 # Set environment variables before importing the app
 os.environ['ENVIRONMENT'] = os.environ.get('ENVIRONMENT', 'production')
 os.environ['DEPLOYMENT'] = os.environ.get('DEPLOYMENT', 'aws')
+# Lambda freezes after responding, so background audio jobs would stall
+os.environ['AUDIO_JOB_MODE'] = os.environ.get('AUDIO_JOB_MODE', 'inline')
 
-# Import the app at module level
-from main import app
+# Import the app at module level, timing each module with IMPORT_PROFILE=1
+from import_profiler import profile_imports
+
+with profile_imports():
+    from main import app
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
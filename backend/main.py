@@ -1,15 +1,23 @@
 from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
 from pydantic import BaseModel
 import rag_pipeline as rp
 import logging
 import os
+import asyncio
+import contextlib
+import json
+import re
 import uuid
-import stripe
 from fastapi.staticfiles import StaticFiles
-import polly_tts as t
-from rate_limiter import rate_limiter
-from firebase_auth import init_firebase, verify_firebase_token
+import polly_tts as p
+import tts_backends as tts
+from rate_limiter import rate_limiter, USAGE_RANGES, USAGE_UNIT
+from clients import close_clients
+from analysis_cache import analysis_cache
+from audio_cache import audio_cache, audio_key, AUDIO_DIR
+from audio_jobs import audio_jobs, AudioJob, AUDIO_JOB_MODE, DONE
+from firebase_auth import firebase_initialized, verify_firebase_token
 from search_routes import router as search_router
 # from firebase_test import router as firebase_test_router
 from datetime import datetime
@@ -23,23 +31,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-try:
-    # Initialize Firebase with better error handling
-    logger.info("Starting Firebase initialization...")
-    init_firebase()
-    logger.info("Firebase initialization completed successfully")
-except Exception as e:
-    logger.error(f"Firebase initialization failed: {str(e)}", exc_info=True)
-    # Don't re-raise, we'll continue with the app even if Firebase fails
-    # This allows the diagnostic endpoints to work
+# Firebase is initialized on first use (see firebase_auth.ensure_firebase)
+# so cold starts don't wait for Secrets Manager
+
+_stripe = None
 
-# Initialize Stripe
-try:
-    stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
-    if not stripe.api_key:
-        logger.warning("STRIPE_SECRET_KEY not set, Stripe functionality will be limited")
-except Exception as e:
-    logger.error(f"Error initializing Stripe: {str(e)}")
+
+def get_stripe():
+    """The Stripe module, imported and configured on first use."""
+    global _stripe
+    if _stripe is None:
+        import stripe
+        stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+        if not stripe.api_key:
+            logger.warning("STRIPE_SECRET_KEY not set, Stripe functionality will be limited")
+        _stripe = stripe
+    return _stripe
+
+# Size of the pieces streamed audio is sent in
+AUDIO_STREAM_CHUNK_BYTES = int(os.getenv("AUDIO_STREAM_CHUNK_BYTES", 16 * 1024))
+AUDIO_FILE_RE = re.compile(r'^[\w-]+\.mp3$')
+AUDIO_JOB_RE = re.compile(r'^[0-9a-f]{64}$')
 
 # Price IDs for different tiers
 PRICE_IDS = {
@@ -51,6 +63,17 @@ PRICE_IDS = {
 # Define request/response models
 class URLInput(BaseModel):
     url: str
+    # Revalidate a cached analysis with a conditional GET before reusing it
+    revalidate: bool = False
+    # Summarize page by page for generate-audio's chunk_summaries, which
+    # costs a Gemini call per page and skips the cached analysis
+    page_summaries: bool = False
+
+
+class FollowUpInput(BaseModel):
+    url: str
+    question: str
+    top_k: int = 5
 
 
 class UpgradeRequest(BaseModel):
@@ -69,11 +92,11 @@ app.add_middleware(CustomCORSMiddleware)
 
 # Try to create audio directory if it doesn't exist
 try:
-    os.makedirs("audio", exist_ok=True)
+    os.makedirs(AUDIO_DIR, exist_ok=True)
     logger.info("Audio directory created or already exists")
     
     # Mount static files
-    app.mount("/audio", StaticFiles(directory="audio"), name="audio")
+    app.mount("/audio", StaticFiles(directory=AUDIO_DIR), name="audio")
 except Exception as e:
     logger.error(f"Error creating audio directory: {str(e)}")
 
@@ -135,13 +158,8 @@ async def health_check():
         "deployment": os.getenv("DEPLOYMENT", "unknown")
     }
     
-    # Check if Firebase is initialized
-    try:
-        from firebase_admin import get_app
-        app = get_app()
-        health_data["firebase"] = "initialized"
-    except Exception as e:
-        health_data["firebase"] = f"not_initialized: {str(e)}"
+    # Firebase is initialized lazily, report without forcing it
+    health_data["firebase"] = "initialized" if firebase_initialized() else "not_initialized"
     
     return JSONResponse(content=health_data)
 
@@ -157,14 +175,15 @@ async def get_rate_limit(request: Request,
                          ):
     try:
         user_id = token.get('uid')
-        remaining = await rate_limiter.get_remaining_requests(user_id)
-        tier = await rate_limiter.get_user_tier(user_id)
+        # The tier comes from the same round trip as today's count
+        remaining, tier = await rate_limiter.get_remaining_requests(user_id)
         limit = rate_limiter.rate_limit_tiers[tier]
         
         return JSONResponse(content={
             "tier": tier,
             "limit": limit,
             "remaining": remaining,
+            "unit": USAGE_UNIT,
             "reset": "next day"
         })
     except Exception as e:
@@ -174,33 +193,19 @@ async def get_rate_limit(request: Request,
 # Usage statistics endpoint
 @app.get("/api/usage/stats")
 async def get_usage_stats(request: Request,
+                         days: int = 30,
                          token: dict = Depends(verify_firebase_token)):
     """Get usage statistics for the current user"""
+    if days not in USAGE_RANGES:
+        raise HTTPException(status_code=400, detail=f"days must be one of {list(USAGE_RANGES)}")
+
     try:
         user_id = token.get('uid')
         logger.debug(f"Fetching usage stats for user: {user_id}")
 
         if request.method != "OPTIONS":
-            # Get daily usage history
-            daily_usage = await rate_limiter.get_daily_usage(user_id)
-            
-            # Get tier and limit info without incrementing
-            tier = await rate_limiter.get_user_tier(user_id)
-            limit = rate_limiter.rate_limit_tiers[tier]
-
-            # Get current counts without incrementing
-            today = datetime.now().strftime('%Y-%m-%d')
-            requests_key = f"user:{user_id}:requests:{today}"
-            current_requests = int(await rate_limiter.redis.get(requests_key) or 0)
-            remaining = limit - current_requests
-            
-            response_data = {
-                "total_limit": limit,
-                "used_requests": current_requests,
-                "remaining_requests": remaining,
-                "daily_usage": daily_usage,
-                "tier": tier
-            }
+            # Tier, today's count and the usage history in one round trip
+            response_data = await rate_limiter.get_usage_stats(user_id, days)
             logger.debug(f"Returning usage stats: {response_data}")
             return JSONResponse(content=response_data)
     except Exception as e:
@@ -214,6 +219,7 @@ async def upgrade_plan(
     request: Request,
     token: dict = Depends(verify_firebase_token)
 ):
+    stripe = get_stripe()
     try:
         user_id = token.get('uid')
 
@@ -269,6 +275,7 @@ async def upgrade_plan(
 # Stripe webhook endpoint
 @app.post("/stripe/webhook")
 async def stripe_webhook(request: Request):
+    stripe = get_stripe()
     try:
         # Get the webhook secret from environment variables
         webhook_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
@@ -320,6 +327,242 @@ async def stripe_webhook(request: Request):
         logger.error(f"Error processing webhook: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+def narration_key(text, backend=None):
+    """Audio cache key, and audio job id, for narrating text"""
+    backend = backend or tts.active_backend()
+    return audio_key(text, backend.voice, backend.engine)
+
+def narrate(text, backend):
+    """Narrate text with a TTS backend, or reuse its cached narration"""
+    summarizer = p.PollyAudioSummarizer(backend)
+
+    def write(output_file):
+        with open(output_file, 'wb') as f:
+            for audio in summarizer.iter_audio(text):
+                f.write(audio)
+        return True
+
+    return audio_cache.get_or_create(narration_key(text, backend), write)
+
+def synthesize_audio(initial_summary):
+    """Generate the audio narration for an already computed summary,
+    reusing the cached file when the same text was narrated before"""
+    backend = tts.active_backend()
+    try:
+        try:
+            audio_file = narrate(initial_summary, backend)
+        except tts.ThrottledError:
+            # Narrate locally rather than fail while Polly is throttling us
+            fallback = tts.get_fallback_backend()
+            if fallback is None or fallback is backend:
+                raise
+            logger.warning(f"{backend.name} is throttled, narrating with {fallback.name}")
+            audio_file = narrate(initial_summary, fallback)
+        if not audio_file:
+            raise RuntimeError("No audio was produced")
+    except Exception as e:
+        logger.error(f"Error synthesizing audio: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to process file")
+
+    return {
+        "status": "success",
+        "audio_file": audio_file,
+        "chunk_summaries": []
+    }
+
+async def queue_audio(summary):
+    """Start narrating summary and describe the audio job.
+
+    In background mode the job is queued and the caller polls its statusUrl;
+    in inline mode the audio is synthesized before returning.
+    """
+    audio_cache.ensure_sweeper()
+    key = narration_key(summary)
+    audio_file = await asyncio.to_thread(audio_cache.get, key)
+    if audio_file or AUDIO_JOB_MODE == "inline":
+        if not audio_file:
+            audio_file = (await asyncio.to_thread(synthesize_audio, summary))["audio_file"]
+        job = AudioJob(key, None)
+        job.update(DONE, audio_file=audio_file)
+        return job.to_dict()
+    job = await audio_jobs.submit(key, summary, synthesize_audio)
+    return job.to_dict()
+
+async def analysis_audio(summary):
+    """The audio job for an analysis summary, or None if it cannot be
+    started. Audio is optional, a failure here should not fail the analysis"""
+    if not summary:
+        return None
+    try:
+        return await queue_audio(summary)
+    except Exception as e:
+        logger.error(f"Error generating audio: {str(e)}")
+        return None
+
+async def cache_analysis(document, result):
+    """Cache an analysis without its audio job, whose state is only current
+    when the analysis finishes. Cache hits queue the audio again."""
+    await analysis_cache.store(document, {key: value for key, value in result.items()
+                                          if key != "audio"})
+
+async def stream_document_analysis(document, result):
+    """Yield each section of the analysis as soon as it is ready.
+
+    The sections are also collected into result so callers can cache or
+    return the complete analysis once the stream is exhausted.
+    """
+    result.update({
+        "documentId": document.content_hash,
+        "articleTitle": "",
+        "summary": "",
+        "qnaPairs": [],
+        "recommendedArticles": [],
+        "audio": None
+    })
+    queue = asyncio.Queue()
+    finished = object()
+
+    await queue.put({"type": "document", "documentId": document.content_hash})
+
+    async def title_branch():
+        result["articleTitle"] = await rp.extract_title_async(document)
+        await queue.put({"type": "title", "articleTitle": result["articleTitle"]})
+
+    async def qna_branch(initial_summary):
+        # Pairs are pushed as soon as they are parsed from the token stream
+        async with contextlib.aclosing(
+                rp.stream_qna_pairs_async(initial_summary)) as pairs:
+            async for q, a in pairs:
+                pair = {"question": q, "answer": a}
+                result["qnaPairs"].append(pair)
+                await queue.put({"type": "qna", **pair})
+        logger.info("Q&A generated")
+
+    async def recommendations_branch(initial_summary):
+        rec_titles, rec_links = await rp.get_recommended_articles_async(
+            initial_summary, document.url)
+        result["recommendedArticles"] = [{"title": t, "link": l} for t,
+                                         l in zip(rec_titles, rec_links)]
+        await queue.put({"type": "recommendedArticles",
+                         "recommendedArticles": result["recommendedArticles"]})
+        logger.info("Recommended articles retrieved")
+
+    async def audio_branch(initial_summary):
+        result["audio"] = await analysis_audio(initial_summary)
+        await queue.put({"type": "audio", "audio": result["audio"]})
+
+    async def index_branch():
+        # Prepare retrieval for follow-up questions, optional like audio
+        try:
+            await rp.index_document_async(document)
+        except Exception as e:
+            logger.error(f"Error indexing document: {str(e)}")
+
+    async def summary_branch():
+        # Get initial summary using Gemini
+        result["summary"] = await rp.generate_summary_async(document)
+        logger.info("Initial summary generated")
+        await queue.put({"type": "summary", "summary": result["summary"]})
+
+        # Everything below only depends on the summary, so the Q&A,
+        # recommendations and audio branches run concurrently
+        async with asyncio.TaskGroup() as group:
+            group.create_task(qna_branch(result["summary"]))
+            group.create_task(recommendations_branch(result["summary"]))
+            group.create_task(audio_branch(result["summary"]))
+
+    async def run():
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(title_branch())
+                group.create_task(summary_branch())
+                group.create_task(index_branch())
+        finally:
+            await queue.put(finished)
+
+    pipeline = asyncio.create_task(run())
+    try:
+        while (event := await queue.get()) is not finished:
+            yield event
+        try:
+            await pipeline
+        except BaseExceptionGroup as eg:
+            # Surface the first failing stage rather than the (nested) groups
+            error = eg
+            while isinstance(error, BaseExceptionGroup):
+                error = error.exceptions[0]
+            raise error
+    finally:
+        # Stop outstanding LLM calls if the consumer went away early
+        if not pipeline.done():
+            pipeline.cancel()
+
+
+async def analyze_document(document):
+    """Run the full analysis pipeline for a fetched document"""
+    result = {}
+    async for _ in stream_document_analysis(document, result):
+        pass
+    return result
+
+
+async def cached_analysis_events(cached):
+    """Replay a cached analysis as the events a fresh stream would produce,
+    with the current state of its audio"""
+    yield {"type": "document", "documentId": cached.get("documentId")}
+    yield {"type": "title", "articleTitle": cached.get("articleTitle", "")}
+    yield {"type": "summary", "summary": cached.get("summary", "")}
+    for pair in cached.get("qnaPairs", []):
+        yield {"type": "qna", **pair}
+    yield {"type": "recommendedArticles",
+           "recommendedArticles": cached.get("recommendedArticles", [])}
+    yield {"type": "audio", "audio": await analysis_audio(cached.get("summary", ""))}
+
+
+async def charge_document(request: Request, token: dict, document, is_internal: bool = False):
+    """Charge the user for the length of a document about to be processed."""
+    pages = await asyncio.to_thread(lambda: document.page_count)
+    await rate_limiter.charge_document(request, token, pages, document.content_hash, is_internal)
+
+async def load_document(url_input: URLInput):
+    """Return (cached analysis, cache status, document) for a URL.
+
+    Either a cached analysis or a freshly downloaded document is returned.
+    """
+    # Serve a previously analyzed URL without touching its server
+    validators = await analysis_cache.get_validators(url_input.url)
+    if validators and not url_input.revalidate:
+        cached = await analysis_cache.get_by_content(validators["content_hash"])
+        if cached:
+            return cached, "HIT", None
+
+    # Download the document once and share it across every stage. With
+    # known validators this is a conditional GET.
+    if validators:
+        document = await rp.fetch_document_async(
+            url_input.url,
+            etag=validators.get("etag"),
+            last_modified=validators.get("last_modified"))
+    else:
+        document = await rp.fetch_document_async(url_input.url)
+
+    if document is None:
+        # 304 Not Modified, the cached analysis is still current
+        cached = await analysis_cache.get_by_content(validators["content_hash"])
+        if cached:
+            await analysis_cache.touch(url_input.url)
+            return cached, "REVALIDATED", None
+        document = await rp.fetch_document_async(url_input.url)
+
+    # The same bytes may already have been analyzed under another URL
+    cached = await analysis_cache.get_by_content(document.content_hash)
+    if cached:
+        await analysis_cache.link(document)
+        document.close()
+        return cached, "HIT", None
+
+    return None, "MISS", document
+
 # QnA generation endpoint
 @app.post("/api/generate-qna")
 async def generate_qna(url_input: URLInput,
@@ -332,47 +575,103 @@ async def generate_qna(url_input: URLInput,
     try:
         logger.info(f"Processing URL: {url_input}")
 
-        # Get initial summary using Gemini
-        initial_summary, article_title = rp.summarize_content(url_input.url)
-        logger.info("Initial summary generated")
+        cached, cache_status, document = await load_document(url_input)
+        if cached:
+            # Finds the finished audio, or narrates the summary again if it is gone
+            cached["audio"] = await analysis_audio(cached.get("summary", ""))
+            return JSONResponse(content=cached, headers={"X-Cache": cache_status})
 
-        topic_list = rp.prompt_llm_for_related_topics(initial_summary)
-        questions, answers = rp.prompt_llm(initial_summary)
-        logger.info("Q&A generated")
+        with document:
+            await charge_document(request, token, document)
+            result = await analyze_document(document)
+            await cache_analysis(document, result)
 
-        # Get recommended articles
-        rec_titles, rec_links = [], []
-        for topic in topic_list[:min(2, len(topic_list))]:
-            results = rp.search_google(topic)
-            new_rec_titles, new_rec_links = \
-                rp.get_top_5_articles(results, url_input.url)
-            rec_titles.extend(new_rec_titles)
-            rec_links.extend(new_rec_links)
+        return JSONResponse(content=result, headers={"X-Cache": cache_status})
+    except rp.DocumentTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        logger.info("Recommended articles retrieved")
+# Streaming QnA generation endpoint
+@app.post("/api/generate-qna/stream")
+async def generate_qna_stream(url_input: URLInput,
+                              request: Request,
+                              token: dict = Depends(verify_firebase_token)
+                              ):
+    """Stream the analysis as NDJSON, or as server-sent events when the
+    client sends Accept: text/event-stream."""
+    # Check rate limit before the response starts so a 429 is still possible
+    await rate_limiter.check_rate_limit(request, token)
+
+    use_sse = "text/event-stream" in request.headers.get("accept", "")
 
-        # Generate audio asynchronously without counting it as a separate request
+    def encode(event):
+        if use_sse:
+            return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        return json.dumps(event) + "\n"
+
+    async def events():
         try:
-            audio_request = Request(scope={"type": "http"})
-            audio_result = await generate_audio(url_input, audio_request, token, is_internal=True)
-            has_audio = True
-            audio_data = audio_result
+            logger.info(f"Streaming analysis for URL: {url_input}")
+            cached, cache_status, document = await load_document(url_input)
+            if cached:
+                async for event in cached_analysis_events(cached):
+                    yield encode(event)
+                yield encode({"type": "done", "cache": cache_status})
+                return
+
+            result = {}
+            with document:
+                await charge_document(request, token, document)
+                async with contextlib.aclosing(
+                        stream_document_analysis(document, result)) as stream:
+                    async for event in stream:
+                        if await request.is_disconnected():
+                            logger.info("Client disconnected, stopping analysis")
+                            return
+                        yield encode(event)
+
+                await cache_analysis(document, result)
+            yield encode({"type": "done", "cache": cache_status})
         except Exception as e:
-            logger.error(f"Error generating audio: {str(e)}")
-            has_audio = False
-            audio_data = None
+            logger.error(f"Error streaming analysis: {str(e)}")
+            yield encode({"type": "error", "detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Follow-up question endpoint
+@app.post("/api/ask")
+async def ask_follow_up(follow_up: FollowUpInput,
+                        request: Request,
+                        token: dict = Depends(verify_firebase_token)
+                        ):
+    """Answer a question about an analyzed document from its most relevant
+    chunks rather than the whole document"""
+    await rate_limiter.check_rate_limit(request, token)
 
-        return JSONResponse(content={
-            "articleTitle": article_title,
-            "summary": initial_summary,
-            "qnaPairs": [{"question": q, "answer": a} for q,
-                         a in zip(questions, answers)],
-            "recommendedArticles": [{"title": t, "link": l} for t,
-                                    l in zip(rec_titles, rec_links)],
-            "audio": audio_data if has_audio else None
-        })
+    try:
+        index = None
+        validators = await analysis_cache.get_validators(follow_up.url)
+        if validators:
+            index = rp.get_document_index(validators["content_hash"])
+
+        if index is None:
+            # Not indexed in this process yet, index it once
+            with await rp.fetch_document_async(follow_up.url) as document:
+                index = await rp.index_document_async(document)
+
+        answer, sources = await rp.answer_question_async(
+            index, follow_up.question, top_k=min(max(follow_up.top_k, 1), 20))
+        return JSONResponse(content={"answer": answer, "sources": sources})
+    except rp.DocumentTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        logger.error(f"Error processing request: {str(e)}")
+        logger.error(f"Error answering follow-up question: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/generate-audio")
@@ -386,31 +685,133 @@ async def generate_audio(url_input: URLInput,
         await rate_limiter.check_rate_limit(request, token)
     
     try:
-        # Initialize the Polly summarizer
-        summarizer = p.PollyAudioSummarizer()
-        
-        # Get the summary content for the audio
-        initial_summary, article_title = rp.summarize_content(url_input.url)
-        
-        # Generate a unique output file name
-        output_file = f"audio/audio_{uuid.uuid4()}.mp3"
-        
-        # Generate the audio file with Polly
-        result = summarizer.process_file(url_input.url, initial_summary, output_file)
-        
-        if result["success"]:
-            return {
-                "status": "success",
-                "audio_file": os.path.basename(output_file),
-                "chunk_summaries": result.get("chunk_summaries", [])
-            }
+        if url_input.page_summaries:
+            # Get the summary content for the audio from a single download
+            with await rp.fetch_document_async(url_input.url) as document:
+                await charge_document(request, token, document, is_internal)
+                initial_summary, chunk_summaries = await rp.map_reduce_summary_async(document)
         else:
-            raise HTTPException(status_code=500, detail="Failed to process file")
-
+            # Narrate the summary generate-qna already produced, which also
+            # finds the audio its background job made for the same text
+            initial_summary = await audio_summary(url_input, request, token, is_internal)
+            chunk_summaries = []
+
+        audio_cache.ensure_sweeper()
+        audio_data = await asyncio.to_thread(synthesize_audio, initial_summary)
+        audio_data["chunk_summaries"] = chunk_summaries
+        return audio_data
+
+    except HTTPException:
+        raise
+    except rp.DocumentTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating audio: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def audio_summary(url_input: URLInput, request: Request, token: dict,
+                        is_internal: bool = False):
+    """The summary to narrate, taken from a cached analysis when possible."""
+    cached = await analysis_cache.get(url_input.url)
+    if cached and cached.get("summary"):
+        return cached["summary"]
+    with await rp.fetch_document_async(url_input.url) as document:
+        await charge_document(request, token, document, is_internal)
+        return await rp.generate_summary_async(document)
+
+async def stream_audio(summarizer, text: str, key: str):
+    """Yield MP3 audio as it is synthesized, storing a copy in the audio cache."""
+    chunks = summarizer.iter_audio(text, chunk_size=AUDIO_STREAM_CHUNK_BYTES)
+    partial_file = os.path.join(AUDIO_DIR, f"{key}.{uuid.uuid4().hex}.part")
+    loop = asyncio.get_running_loop()
+    pending = None
+    try:
+        with open(partial_file, 'wb') as f:
+            while True:
+                # Shielded so a disconnect cannot abandon next() mid-call
+                pending = loop.run_in_executor(None, next, chunks, None)
+                chunk = await asyncio.shield(pending)
+                if chunk is None:
+                    break
+                f.write(chunk)
+                yield chunk
+        # Only complete files are published for seeking
+        await asyncio.to_thread(audio_cache.put, key, partial_file)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(partial_file)
+        # The generator can only be closed once no thread is running it
+        if pending is not None and not pending.done():
+            await asyncio.wait([pending])
+        # Closing it cancels queued pieces and shuts down its executor
+        await asyncio.to_thread(chunks.close)
+
+# Streaming audio endpoint
+@app.post("/api/generate-audio/stream")
+async def generate_audio_stream(url_input: URLInput,
+                                request: Request,
+                                token: dict = Depends(verify_firebase_token)
+                                ):
+    """Stream the narration as MP3 while it is being synthesized, so playback
+    starts after the first chunk instead of the whole file. The finished file
+    is named in the X-Audio-File header and can be fetched with Range
+    requests from /api/audio/{filename}."""
+    await rate_limiter.check_rate_limit(request, token)
+
+    try:
+        summary = await audio_summary(url_input, request, token)
+    except rp.DocumentTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error summarizing for audio stream: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    audio_cache.ensure_sweeper()
+    summarizer = p.PollyAudioSummarizer(tts.active_backend())
+    key = narration_key(summary, summarizer.backend)
+    audio_file = await asyncio.to_thread(audio_cache.get, key)
+    if audio_file:
+        # Already narrated, the whole file can be sent with Range support
+        return FileResponse(os.path.join(AUDIO_DIR, audio_file), media_type="audio/mpeg",
+                            headers={"X-Audio-File": audio_file})
+
+    return StreamingResponse(
+        stream_audio(summarizer, summary, key),
+        media_type="audio/mpeg",
+        headers={"X-Audio-File": audio_cache.store.filename(key), "Cache-Control": "no-cache",
+                 "X-Accel-Buffering": "no"}
+    )
+
+# Audio job status
+@app.get("/api/audio-jobs/{job_id}")
+async def get_audio_job(job_id: str, token: dict = Depends(verify_firebase_token)):
+    """Report whether queued audio is queued, running, done or failed, with
+    the URL of the audio once it is done."""
+    job = await audio_jobs.get(job_id)
+    if job and job.status == DONE and not os.path.isfile(os.path.join(AUDIO_DIR, job.audio_file)):
+        # The audio has been evicted since the job finished
+        job = None
+    if job is None and AUDIO_JOB_RE.match(job_id):
+        # Finished before this process started, or its record has expired
+        audio_file = await asyncio.to_thread(audio_cache.get, job_id)
+        if audio_file:
+            job = AudioJob(job_id, None)
+            job.update(DONE, audio_file=audio_file)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Audio job not found")
+    return job.to_dict()
+
+# Finished audio files
+@app.get("/api/audio/{filename}")
+async def get_audio_file(filename: str):
+    """Serve a finished audio file. FileResponse answers Range requests with
+    206 Partial Content, so players can seek without downloading it all."""
+    path = os.path.join(AUDIO_DIR, filename)
+    if not AUDIO_FILE_RE.match(filename) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    return FileResponse(path, media_type="audio/mpeg",
+                        headers={"Cache-Control": "public, max-age=86400"})
+
 # Root endpoint with diagnostic information
 @app.get("/")
 async def root():
@@ -424,7 +825,12 @@ async def root():
             ],
             "api": [
                 "/api/generate-qna",
+                "/api/generate-qna/stream",
+                "/api/ask",
                 "/api/generate-audio",
+                "/api/generate-audio/stream",
+                "/api/audio/{filename}",
+                "/api/audio-jobs/{job_id}",
                 "/api/search",
                 "/api/rate-limit",
                 "/api/usage/stats"
@@ -435,4 +841,7 @@ async def root():
 # Shutdown event handler
 @app.on_event("shutdown")
 async def shutdown_event():
-    await rate_limiter.close()
\ No newline at end of file
+    await rate_limiter.close()
+    await audio_jobs.close()
+    await audio_cache.close()
+    await close_clients()
\ No newline at end of file
@@ -0,0 +1,92 @@
+# Layer III bitrates in kbps by bitrate index
+MPEG1_BITRATES = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+MPEG2_BITRATES = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+# Sample rates by version bits (3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5)
+SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def frame_length(header: bytes):
+    """Length in bytes of the Layer III frame starting with header, or None
+    if header is not a valid frame header."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x3
+    layer = (header[1] >> 1) & 0x3
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x3
+    padding = (header[2] >> 1) & 0x1
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    bitrate = (MPEG1_BITRATES if version == 3 else MPEG2_BITRATES)[bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    samples_per_byte = 144 if version == 3 else 72
+    return samples_per_byte * bitrate // sample_rate + padding
+
+
+def _id3v2_length(data: bytes) -> int:
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    # Tag size is a 28-bit "syncsafe" integer, 7 bits per byte
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _leading_metadata_length(data: bytes):
+    """Bytes of ID3v2 tag and Xing/Info frame at the start of data, or None
+    if more data is needed to tell."""
+    if len(data) < 10:
+        return None
+    start = _id3v2_length(data)
+    if len(data) < start + 4:
+        return None
+    length = frame_length(data[start:start + 4])
+    if length:
+        if len(data) < start + min(length, 64):
+            return None
+        first_frame = data[start:start + min(length, 64)]
+        if b'Xing' in first_frame or b'Info' in first_frame:
+            return start + length
+    return start
+
+
+def strip_metadata(data: bytes) -> bytes:
+    """Drop ID3 tags and a leading Xing/Info frame so that MP3 streams can
+    be concatenated into one file that reports the right duration."""
+    start = _leading_metadata_length(data) or _id3v2_length(data)
+    end = len(data)
+    if end - start >= 128 and data[end - 128:end - 125] == b'TAG':
+        end -= 128
+    return data[start:end]
+
+
+def strip_stream_metadata(chunks):
+    """strip_metadata for an iterable of byte chunks.
+
+    Audio is yielded as it arrives; only the first few bytes (to find the
+    leading tags) and the last 128 bytes (a possible ID3v1 tag) are held back.
+    """
+    buffer = b""
+    skip = None
+    for chunk in chunks:
+        buffer += chunk
+        if skip is None:
+            skip = _leading_metadata_length(buffer)
+            if skip is None:
+                continue
+        if skip:
+            dropped = min(skip, len(buffer))
+            buffer = buffer[dropped:]
+            skip -= dropped
+        if len(buffer) > 128:
+            yield buffer[:-128]
+            buffer = buffer[-128:]
+    if skip is None:
+        # Too short to hold any tags
+        skip = 0
+    buffer = buffer[skip:]
+    if len(buffer) >= 128 and buffer[-128:-125] == b'TAG':
+        buffer = buffer[:-128]
+    if buffer:
+        yield buffer
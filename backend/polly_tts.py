@@ -1,43 +1,94 @@
 import os
-import boto3
 import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from chunker import split_sentences
+from tts_backends import get_tts_backend
+
+logger = logging.getLogger(__name__)
+
+POLLY_CONCURRENCY = int(os.getenv("POLLY_CONCURRENCY", 4))
+
+
+def split_text(text, max_chars):
+    """Split text into pieces of at most max_chars characters, breaking at
+    sentence boundaries (or word boundaries inside very long sentences)."""
+    pieces = []
+    current = ""
+    for paragraph in text.split("\n"):
+        for sentence in split_sentences(' '.join(paragraph.split())):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(' ', 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                if current:
+                    pieces.append(current)
+                    current = ""
+                pieces.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                pieces.append(current)
+                current = ""
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
 
 class PollyAudioSummarizer:
-    def __init__(self):
-        # Initialize Polly client
-        self.polly_client = boto3.client('polly')
-        
+    def __init__(self, backend=None, concurrency=POLLY_CONCURRENCY):
+        # Polly unless TTS_BACKEND selects another engine
+        self.backend = backend or get_tts_backend()
+        self.voice = self.backend.voice
+        self.engine = self.backend.engine
+        self.concurrency = concurrency
+
+    def iter_audio(self, text, chunk_size=None):
+        """Yield the MP3 audio of text piece by piece, in order.
+
+        Pieces are synthesized concurrently, so total time is close to the
+        slowest piece rather than the sum of all of them. With chunk_size,
+        the first piece is streamed in chunks of that size as it arrives so
+        playback can start before it is complete.
+        """
+        pieces = split_text(text, self.backend.max_chars)
+        if not pieces:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(pieces))) as executor:
+            rest = pieces[1:] if chunk_size else pieces
+            futures = [executor.submit(self.backend.synthesize, piece) for piece in rest]
+            try:
+                if chunk_size:
+                    yield from self.backend.stream(pieces[0], chunk_size)
+                for future in futures:
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
     def text_to_speech(self, text, output_file):
-        """Convert text to speech using Amazon Polly"""
+        """Convert text to speech with the configured TTS backend"""
         try:
-            response = self.polly_client.synthesize_speech(
-                Text=text,
-                OutputFormat='mp3',
-                VoiceId='Brian',  # Similar to the Azure voice you were using
-                Engine='neural'  # Use the neural engine for better quality
-            )
-            
-            # Write the audio stream to a file
-            if "AudioStream" in response:
-                with open(output_file, 'wb') as file:
-                    file.write(response['AudioStream'].read())
-                return True
-            else:
-                return False
+            with open(output_file, 'wb') as file:
+                for audio in self.iter_audio(text):
+                    file.write(audio)
+            return True
         except Exception as e:
-            print(f"Error in text_to_speech: {str(e)}")
+            logger.error(f"Error in text_to_speech: {str(e)}")
+            if os.path.exists(output_file):
+                os.remove(output_file)
             return False
-    
-    def process_file(self, url, final_summary, output_file="summary.mp3"):
+
+    def process_file(self, final_summary, output_file="summary.mp3"):
         """Generate audio from the summary text"""
         try:
             # Generate a unique filename
             if not output_file:
                 output_file = f"audio/audio_{uuid.uuid4()}.mp3"
-            
+
             # Generate audio
             success = self.text_to_speech(final_summary, output_file)
-            
+
             if success:
                 return {
                     "success": True,
@@ -46,7 +97,7 @@ class PollyAudioSummarizer:
                 }
             else:
                 return {"success": False, "error": "Failed to generate audio"}
-                
+
         except Exception as e:
-            print(f"Error processing file: {str(e)}")
-            return {"success": False, "error": str(e)}
\ No newline at end of file
+            logger.error(f"Error processing file: {str(e)}")
+            return {"success": False, "error": str(e)}
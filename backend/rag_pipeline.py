@@ -1,29 +1,247 @@
-from PyPDF2 import PdfReader
-from io import BytesIO
-import openai
+import asyncio
+import hashlib
+import random
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
 import re
 import os
 import ast
-import requests
 import logging
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-import httpx
-from bs4 import BeautifulSoup
-import fitz
+import chunker
+import clients
+from vector_index import VectorIndex, get_embedder
+from document_store import document_store
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 
-def extract_arxiv_title(pdf_url):
-    """Extract title from arXiv papers"""
-    
-    # Download the PDF
-    response = requests.get(pdf_url)
-    pdf_data = BytesIO(response.content)
+# Largest document we are willing to download and parse
+MAX_DOCUMENT_BYTES = int(os.getenv("MAX_DOCUMENT_BYTES", 100 * 1024 * 1024))
+# Documents above this size are uploaded through the Gemini Files API
+# instead of being sent inline with the request
+INLINE_DOCUMENT_BYTES = int(os.getenv("INLINE_DOCUMENT_BYTES", 20 * 1024 * 1024))
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+# Size of the sections HTML and plain text documents are split into for
+# page-by-page summaries
+SECTION_TOKENS = int(os.getenv("SECTION_TOKENS", 4000))
+# Token budget for the content included in the Q&A prompt
+QNA_CONTEXT_TOKENS = int(os.getenv("QNA_CONTEXT_TOKENS", 12000))
+# Retrieval chunks are small so a follow-up prompt only carries what it needs
+RETRIEVAL_CHUNK_TOKENS = int(os.getenv("RETRIEVAL_CHUNK_TOKENS", 400))
+RETRIEVAL_CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", 50))
+# Number of document indexes kept in memory per process
+MAX_CACHED_INDEXES = int(os.getenv("MAX_CACHED_INDEXES", 32))
+
+
+class DocumentTooLargeError(ValueError):
+    """Raised when a document exceeds MAX_DOCUMENT_BYTES."""
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class Document:
+    """A fetched document shared by every stage of a single analysis.
+
+    The body is spooled to a temporary file while downloading, so memory
+    use does not grow with the size of the document. PDFs are opened once
+    with PyMuPDF straight from that file and pages are only loaded when
+    their text is requested.
+    """
+
+    def __init__(self, url, path, content_type, size, content_hash,
+                 etag=None, last_modified=None):
+        self.url = url
+        self.path = path
+        # Drop parameters such as "; charset=utf-8" so comparisons are stable
+        self.content_type = content_type.split(';')[0].strip().lower()
+        self.size = size
+        # SHA-256 of the raw bytes, used to address cached analyses
+        self.content_hash = content_hash
+        # HTTP validators used to revalidate cached analyses
+        self.etag = etag
+        self.last_modified = last_modified
+        self._text = None
+        self._pages = None
+        self._title = None
+        self._pdf = None
+        self._soup = None
+        # PyMuPDF documents must not be used from two threads at once, and
+        # the HTML and page text are only parsed once
+        self._lock = threading.RLock()
+        self._finalizer = weakref.finalize(self, _remove_file, path)
+
+    @property
+    def content(self):
+        """Raw bytes of the document, read from disk on each access."""
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    @property
+    def is_pdf(self):
+        return self.content_type == 'application/pdf'
+
+    @property
+    def is_html(self):
+        return self.content_type == 'text/html'
+
+    def open_pdf(self):
+        """The PyMuPDF document, opened from disk on first use."""
+        with self._lock:
+            if self._pdf is None:
+                import fitz
+                self._pdf = fitz.open(self.path, filetype="pdf")
+            return self._pdf
+
+    def html(self):
+        """The parsed HTML, parsed on first use. Callers must not modify
+        the tree, it is shared by threads reading the title and the text."""
+        with self._lock:
+            if self._soup is None:
+                from bs4 import BeautifulSoup
+                self._soup = BeautifulSoup(self.content, 'html.parser')
+            return self._soup
+
+    @property
+    def metadata(self):
+        """PDF metadata such as title and author, empty for other types."""
+        if not self.is_pdf:
+            return {}
+        with self._lock:
+            return self.open_pdf().metadata or {}
+
+    def iter_pages(self):
+        """Yield the text of each page (PDF) or section (HTML) lazily."""
+        if self.is_pdf:
+            with self._lock:
+                pdf = self.open_pdf()
+                for page_num in range(pdf.page_count):
+                    page = pdf.load_page(page_num)
+                    # Keep text blocks as paragraphs so chunking can
+                    # respect them
+                    blocks = (' '.join(block[4].split())
+                              for block in page.get_text("blocks")
+                              if block[6] == 0)
+                    yield '\n\n'.join(block for block in blocks if block)
+        else:
+            yield from extract_pages(self)
+
+    @property
+    def text(self):
+        """Plain text of the document, parsed once on first access."""
+        if self._text is None:
+            self._text = "\n".join(self.pages)
+        return self._text
+
+    @property
+    def pages(self):
+        """Text of each page (PDF) or section (HTML), parsed once."""
+        if self._pages is None:
+            # Extracted once even when the title and the index ask at once
+            with self._lock:
+                if self._pages is None:
+                    try:
+                        self._pages = list(self.iter_pages())
+                    except Exception as e:
+                        logger.exception(e)
+                        self._pages = []
+        return self._pages
+
+    @property
+    def page_count(self):
+        """Number of pages (PDF) or sections (HTML)."""
+        if self.is_pdf:
+            with self._lock:
+                return self.open_pdf().page_count
+        return len(self.pages)
+
+    @property
+    def title(self):
+        """Title of the document, extracted once on first access."""
+        if self._title is None:
+            with self._lock:
+                self._title = extract_title(self)
+        return self._title
+
+    def close(self):
+        """Close the parser and delete the spooled file."""
+        # Never wait on a parse still running in a worker thread, the
+        # finalizer releases the parser once that thread lets go of it
+        if self._lock.acquire(blocking=False):
+            try:
+                if self._pdf is not None:
+                    self._pdf.close()
+                    self._pdf = None
+            finally:
+                self._lock.release()
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _DocumentSpool:
+    """Write a streamed download to a temporary file.
+
+    The body is hashed as it arrives and the download is aborted as soon as
+    it exceeds MAX_DOCUMENT_BYTES.
+    """
+
+    def __init__(self, url, response):
+        self.url = url
+        self.headers = response.headers
+        declared_size = int(self.headers.get('Content-Length') or 0)
+        if declared_size > MAX_DOCUMENT_BYTES:
+            raise DocumentTooLargeError(
+                f"Document is {declared_size} bytes, the limit is {MAX_DOCUMENT_BYTES}")
+        self.file = tempfile.NamedTemporaryFile(prefix="document_", delete=False)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > MAX_DOCUMENT_BYTES:
+            raise DocumentTooLargeError(
+                f"Document exceeds the limit of {MAX_DOCUMENT_BYTES} bytes")
+        self.sha256.update(chunk)
+        self.file.write(chunk)
+
+    def abort(self):
+        self.file.close()
+        _remove_file(self.file.name)
+
+    def finish(self):
+        self.file.close()
+        return Document(self.url, self.file.name,
+                        self.headers.get('Content-Type', ''),
+                        self.size, self.sha256.hexdigest(),
+                        etag=self.headers.get('ETag'),
+                        last_modified=self.headers.get('Last-Modified'))
+
+
+def _conditional_headers(etag=None, last_modified=None):
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def extract_arxiv_title(pdf_url, pdf_doc):
+    """Extract title from arXiv papers, or from the open PyMuPDF document"""
     
     # Try to extract arXiv ID first
     arxiv_id = None
@@ -36,7 +254,7 @@ def extract_arxiv_title(pdf_url):
     if arxiv_id:
         try:
             api_url = f"https://export.arxiv.org/api/query?id_list={arxiv_id}"
-            response = requests.get(api_url)
+            response = clients.get_http_client().get(api_url)
             if response.status_code == 200:
                 import xml.etree.ElementTree as ET
                 root = ET.fromstring(response.content)
@@ -48,9 +266,9 @@ def extract_arxiv_title(pdf_url):
         except Exception as e:
             print(f"API method failed: {e}")
     
-    # Fallback to direct PDF extraction
+    # Fallback to direct PDF extraction from the caller's open document
     try:
-        doc = fitz.open(stream=pdf_data, filetype="pdf")
+        doc = pdf_doc
         
         # Strategy 1: Look for largest text on first page
         page = doc[0]
@@ -94,41 +312,70 @@ def extract_arxiv_title(pdf_url):
     except Exception as e:
         print(f"PDF extraction failed: {e}")
         return "Extraction Failed"
-    finally:
-        if 'doc' in locals():
-            doc.close()
-
-
-def summarize_content(url):
-    client = genai.Client()
-    doc_data = httpx.get(url)
-    content_type = doc_data.headers.get('Content-Type', '')
-
-    prompt = "Summarize this document"
-    response = client.models.generate_content(
-        model="gemini-1.5-flash",
-        contents=[
-            types.Part.from_bytes(
-                data=doc_data.content,
-                mime_type=content_type,
-            ),
-            prompt])
+
+
+# Block level HTML elements that make up the paragraphs of an article
+HTML_BLOCK_TAGS = ['p', 'li', 'pre', 'blockquote', 'td', 'dd',
+                   'h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+HTML_HIDDEN_TAGS = {'script', 'style'}
+
+
+def _visible_text(element):
+    """Text of an element without script and style contents, leaving the
+    shared tree untouched."""
+    return ' '.join(' '.join(string for string in element.strings
+                             if string.parent.name not in HTML_HIDDEN_TAGS).split())
+
+
+def extract_html_text(soup):
+    """Extract article text from parsed HTML, one paragraph per block
+    element and headings marked with '#' so the chunker can see them."""
+    full_text = _visible_text(soup)
+
+    paragraphs = []
+    for element in soup.find_all(HTML_BLOCK_TAGS):
+        # Nested blocks (a <p> inside an <li>) are emitted by the innermost one
+        if element.find(HTML_BLOCK_TAGS):
+            continue
+        text = _visible_text(element)
+        if not text:
+            continue
+        if element.name[0] == 'h' and element.name[1:].isdigit():
+            text = f"{'#' * int(element.name[1:])} {text}"
+        paragraphs.append(text)
+
+    text = '\n\n'.join(paragraphs)
+    # Pages that keep their text outside block elements lose too much this
+    # way, use the flat text instead
+    if len(text) < len(full_text) // 2:
+        return full_text
+    return text
+
+
+def extract_pages(document):
+    """Extract the text of each section of an HTML or plain text document"""
+    if document.is_html:
+        text = extract_html_text(document.html())
+    else:
+        text = document.content.decode('utf-8', errors='ignore')
+    return [chunk.text for chunk in chunker.chunk_text(text, SECTION_TOKENS)]
+
+
+def extract_title(document):
+    """Extract the title of a fetched PDF or HTML document"""
     title = ""
-    if content_type == 'application/pdf':
-        pdf_file = BytesIO(doc_data.content)
+    if document.is_pdf:
         try:
-            pdf_reader = PdfReader(pdf_file)
             # Try to get title from PDF metadata
-            title = pdf_reader.metadata.get('/Title', '')
+            title = (document.metadata.get('title') or '').strip()
             if title == '':
-                title = extract_arxiv_title(url)
+                title = extract_arxiv_title(document.url, document.open_pdf())
         except Exception as e:
             logger.exception(e)
             pass
-    if content_type == 'text/html':
-        soup = BeautifulSoup(doc_data.text, 'html.parser')
-        title = ""
-        if soup.title:
+    if document.is_html:
+        soup = document.html()
+        if soup.title and soup.title.string:
             title = soup.title.string.strip()
         if not title:
             meta_title = soup.find('meta', property='og:title')
@@ -138,11 +385,39 @@ def summarize_content(url):
             meta_title = soup.find('meta', attrs={'name': 'title'})
             if meta_title:
                 title = meta_title.get('content', '').strip()
-    
-    return response.text, title
+    return title
+
+
+SUMMARY_MODEL = "gemini-1.5-flash"
+# Maximum number of concurrent Gemini calls for a page-by-page summary
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", 8))
+SUMMARY_MAX_RETRIES = int(os.getenv("SUMMARY_MAX_RETRIES", 5))
+CHAT_MODEL = "gpt-3.5-turbo"
+GOOGLE_SEARCH_URL = "https://www.googleapis.com/customsearch/v1"
+
+
+SUMMARY_PROMPT = "Summarize this document"
+
+
+async def _summary_contents_async(client, document):
+    from google.genai import types
+    if document.size > INLINE_DOCUMENT_BYTES:
+        # Stream large files from disk rather than inlining them
+        uploaded = await client.files.upload(
+            file=document.path,
+            config=types.UploadFileConfig(mime_type=document.content_type))
+        return [uploaded, SUMMARY_PROMPT]
+    content = await asyncio.to_thread(lambda: document.content)
+    return [
+        types.Part.from_bytes(
+            data=content,
+            mime_type=document.content_type,
+        ),
+        SUMMARY_PROMPT]
 
 
-def prompt_llm(final_summary):
+def _qna_messages(final_summary):
+    final_summary = chunker.truncate_to_tokens(final_summary, QNA_CONTEXT_TOKENS)
     prompt = f"""
     Based on the following content: {final_summary} generate 10-15 questions
     that will help readers understand the content better then provide
@@ -154,62 +429,379 @@ def prompt_llm(final_summary):
     Just output the question followed directly by the answer.
     Make sure you don't use LaTeX in your questions and answers.
     """
-    response = openai.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant who generates FAQs from website content."},
-            {"role": "user", "content": prompt},
-        ]
-    )
-    answer = response.choices[0].message.content
-    faq_list = re.split(r"\n+", answer)
-    questions = [faq for i, faq in enumerate(faq_list) if i % 2 == 0]
-    answers = [faq for i, faq in enumerate(faq_list) if i % 2 == 1]
-    return questions, answers
+    return [
+        {"role": "system", "content": "You are a helpful assistant who generates FAQs from website content."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+class QnAPairParser:
+    """Incrementally pair question and answer lines from streamed text.
+
+    The model is asked to output each question followed directly by its
+    answer, one per line, so non-empty lines alternate question/answer.
+    """
 
+    def __init__(self):
+        self._buffer = ""
+        self._question = None
 
-def prompt_llm_for_related_topics(final_summary):
+    def _pair_line(self, line):
+        line = line.strip()
+        if not line:
+            return None
+        if self._question is None:
+            self._question = line
+            return None
+        pair = (self._question, line)
+        self._question = None
+        return pair
+
+    def feed(self, text):
+        """Add streamed text and return the pairs completed by it."""
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        pairs = []
+        for line in lines:
+            pair = self._pair_line(line)
+            if pair:
+                pairs.append(pair)
+        return pairs
+
+    def flush(self):
+        """Return the final pair once the stream has ended."""
+        line, self._buffer = self._buffer, ""
+        pair = self._pair_line(line)
+        return [pair] if pair else []
+
+
+def _related_topics_messages(final_summary):
     prompt = f"""
     Based on the following content: {final_summary} generate exactly 2 topics
     that are related to this topic or discussed in the article summary.
     Provide your answer in the format '['Topic 1', 'Topic 2']'
     """
-
-    response = openai.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant who generates topics related to article summaries."},
-            {"role": "user", "content": prompt},
-        ]
-    )
-    topic_list_str = response.choices[0].message.content
-    topic_list = ast.literal_eval(topic_list_str)
-    return topic_list
+    return [
+        {"role": "system", "content": "You are a helpful assistant who generates topics related to article summaries."},
+        {"role": "user", "content": prompt},
+    ]
 
 
-def search_google(query):
+def _search_params(query):
     google_api_key = os.getenv("GOOGLE_API_KEY")
     search_engine_id = os.getenv("SEARCH_ENGINE_ID")
     
     if not google_api_key or not search_engine_id:
         raise ValueError("Missing required Google API credentials")
         
-    url = "https://www.googleapis.com/customsearch/v1"
-    params = {
+    return {
         "key": google_api_key,
         "cx": search_engine_id,
         "q": query,
     }
-    response = requests.get(url, params=params)
-    results = response.json()
-    return results
 
 
 def get_top_5_articles(results, past_url):
     titles = []
     links = []
-    for item in results['items'][:5]:
-        if 'items' in results and item['link'] != past_url:
+    for item in results.get('items', [])[:5]:
+        if item['link'] != past_url:
             titles.append(item['title'])
             links.append(item['link'])
     return titles, links
+
+
+# Async pipeline
+#
+# The stages below use async HTTP and LLM clients so that the API can serve
+# other requests while waiting on the network, and so that independent
+# stages can run concurrently.
+
+async def fetch_document_async(url, etag=None, last_modified=None):
+    """Download a URL once without blocking the event loop.
+
+    When validators from a previous fetch are given a conditional GET is
+    made, and None is returned if the server reports the document unchanged.
+    """
+    headers = _conditional_headers(etag, last_modified)
+    client = clients.get_async_http_client()
+    async with client.stream("GET", url, headers=headers) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        spool = _DocumentSpool(url, response)
+        try:
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+                spool.write(chunk)
+        except BaseException:
+            spool.abort()
+            raise
+    return spool.finish()
+
+
+async def generate_summary_async(document):
+    """Summarize a document with Gemini"""
+    client = clients.get_async_genai_client()
+    response = await client.models.generate_content(
+        model=SUMMARY_MODEL,
+        contents=await _summary_contents_async(client, document))
+    return response.text
+
+
+def _is_rate_limited(error):
+    """Whether an LLM error is a quota/overload error worth retrying"""
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    return code in (429, 503) or 'RESOURCE_EXHAUSTED' in str(error)
+
+
+async def _generate_with_backoff(client, contents, max_retries=SUMMARY_MAX_RETRIES):
+    """Call Gemini, retrying rate limited requests with exponential backoff"""
+    for attempt in range(max_retries + 1):
+        try:
+            return await client.models.generate_content(
+                model=SUMMARY_MODEL,
+                contents=contents)
+        except Exception as e:
+            if attempt == max_retries or not _is_rate_limited(e):
+                raise
+            # Full jitter so parallel pages don't retry in lockstep
+            delay = random.uniform(0, min(30, 2 ** attempt))
+            logger.warning(f"Gemini rate limited, retrying in {delay:.1f}s "
+                           f"(attempt {attempt + 1}/{max_retries})")
+            await asyncio.sleep(delay)
+
+
+def _page_summary_prompt(text):
+    return f"""Please create a concise summary of the following text, focusing on key information:
+
+    Text to summarize:
+    {text}
+
+    Summary:"""
+
+
+def _reduce_summary_prompt(page_summaries):
+    combined = "\n\n".join(
+        f"Page {summary['page']}: {summary['summary']}" for summary in page_summaries)
+    return f"""Combine these page summaries of a single document into one
+    well-structured summary of the whole document:
+
+    {combined}"""
+
+
+async def summarize_pages_async(document, concurrency=SUMMARY_CONCURRENCY):
+    """Map step: summarize every page concurrently, at most `concurrency`
+    Gemini calls at a time. Pages that fail are logged and skipped."""
+    client = clients.get_async_genai_client()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarize_page(page_num, text):
+        try:
+            async with semaphore:
+                response = await _generate_with_backoff(
+                    client, [_page_summary_prompt(text)])
+            return {"page": page_num, "summary": response.text}
+        except Exception as e:
+            logger.error(f"Error summarizing page {page_num}: {str(e)}")
+            return None
+
+    # Page text is parsed on first access, keep that off the event loop
+    pages = await asyncio.to_thread(lambda: document.pages)
+    summaries = await asyncio.gather(*(
+        summarize_page(page_num, text)
+        for page_num, text in enumerate(pages, 1) if text.strip()))
+    return [summary for summary in summaries if summary and summary["summary"]]
+
+
+async def map_reduce_summary_async(document, concurrency=SUMMARY_CONCURRENCY):
+    """Summarize each page in parallel then reduce into a final summary.
+
+    Returns the final summary and the per-page summaries.
+    """
+    page_summaries = await summarize_pages_async(document, concurrency)
+    if not page_summaries:
+        # Nothing could be extracted page by page (e.g. a scanned PDF), let
+        # Gemini read the raw document instead
+        return await generate_summary_async(document), []
+    if len(page_summaries) == 1:
+        return page_summaries[0]["summary"], page_summaries
+
+    client = clients.get_async_genai_client()
+    response = await _generate_with_backoff(
+        client, [_reduce_summary_prompt(page_summaries)])
+    return response.text, page_summaries
+
+
+async def extract_title_async(document):
+    """Extract a document's title without blocking the event loop"""
+    # Title extraction is blocking (parsing, arXiv API) so it runs in a thread
+    return await asyncio.to_thread(lambda: document.title)
+
+
+async def stream_qna_pairs_async(final_summary):
+    """Yield (question, answer) pairs as the completion streams in.
+
+    Closing the generator early (e.g. when the client disconnects) closes
+    the underlying stream and stops generation.
+    """
+    client = clients.get_async_openai_client()
+    stream = await client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=_qna_messages(final_summary),
+        stream=True
+    )
+    parser = QnAPairParser()
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                for pair in parser.feed(chunk.choices[0].delta.content):
+                    yield pair
+        for pair in parser.flush():
+            yield pair
+    finally:
+        await stream.close()
+
+
+async def prompt_llm_for_related_topics_async(final_summary):
+    client = clients.get_async_openai_client()
+    response = await client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=_related_topics_messages(final_summary)
+    )
+    topic_list_str = response.choices[0].message.content
+    return ast.literal_eval(topic_list_str)
+
+
+async def search_google_async(query):
+    response = await clients.get_async_http_client().get(
+        GOOGLE_SEARCH_URL, params=_search_params(query))
+    return response.json()
+
+
+async def get_recommended_articles_async(final_summary, past_url, max_topics=2):
+    """Find related topics then search for all of them concurrently"""
+    topic_list = await prompt_llm_for_related_topics_async(final_summary)
+    results = await asyncio.gather(
+        *(search_google_async(topic) for topic in topic_list[:max_topics]))
+
+    rec_titles, rec_links = [], []
+    for result in results:
+        new_rec_titles, new_rec_links = get_top_5_articles(result, past_url)
+        rec_titles.extend(new_rec_titles)
+        rec_links.extend(new_rec_links)
+    return rec_titles, rec_links
+
+
+# Retrieval
+#
+# Documents are split into small chunks and embedded once. Follow-up
+# questions then embed only the question and send the closest chunks to the
+# chat model instead of the whole document.
+
+_document_indexes = OrderedDict()
+_document_indexes_lock = threading.Lock()
+
+
+def _remember_index(content_hash, index):
+    with _document_indexes_lock:
+        _document_indexes[content_hash] = index
+        while len(_document_indexes) > MAX_CACHED_INDEXES:
+            _document_indexes.popitem(last=False)
+
+
+def get_document_index(content_hash, embedder=None):
+    """Return the index of a document from memory or the on-disk store, or
+    None if it has not been built with the current embedder."""
+    with _document_indexes_lock:
+        index = _document_indexes.get(content_hash)
+        if index is not None:
+            _document_indexes.move_to_end(content_hash)
+            return index
+
+    try:
+        stored = document_store.load(content_hash)
+    except Exception as e:
+        logger.error(f"Error loading stored document {content_hash[:12]}: {str(e)}")
+        stored = None
+    if stored is None:
+        return None
+    meta, chunks, vectors = stored
+    embedder = embedder or get_embedder()
+    if meta["embedder"] != embedder.name:
+        return None
+
+    index = VectorIndex(vectors, chunks, meta["embedder"])
+    _remember_index(content_hash, index)
+    return index
+
+
+def index_document(document, embedder=None):
+    """Chunk and embed a document, reusing the index if it already exists"""
+    embedder = embedder or get_embedder()
+    index = get_document_index(document.content_hash, embedder)
+    if index is not None:
+        return index
+
+    if document.is_pdf:
+        chunks = chunker.chunk_pages(document.pages, RETRIEVAL_CHUNK_TOKENS,
+                                     RETRIEVAL_CHUNK_OVERLAP)
+    else:
+        chunks = chunker.chunk_text(document.text, RETRIEVAL_CHUNK_TOKENS,
+                                    RETRIEVAL_CHUNK_OVERLAP)
+    vectors = embedder.embed([chunk.text for chunk in chunks])
+    index = VectorIndex(vectors, chunks, embedder.name)
+    logger.info(f"Indexed {len(chunks)} chunks of {document.url}")
+
+    # Persist so later cold starts don't parse and embed the document again
+    try:
+        document_store.save(document.content_hash, chunks, vectors, embedder.name,
+                            url=document.url, title=document.title)
+    except Exception as e:
+        logger.error(f"Error storing document index: {str(e)}")
+
+    _remember_index(document.content_hash, index)
+    return index
+
+
+async def index_document_async(document, embedder=None):
+    return await asyncio.to_thread(index_document, document, embedder)
+
+
+def _follow_up_messages(question, results):
+    context = "\n\n".join(
+        f"[{n}]{f' (page {chunk.page})' if chunk.page else ''} {chunk.text}"
+        for n, (chunk, _) in enumerate(results, 1))
+    prompt = f"""
+    Answer the question using only the numbered excerpts from the document below.
+    If the excerpts don't contain the answer, say that the document doesn't cover it.
+    Make sure you don't use LaTeX in your answer.
+
+    Excerpts:
+    {context}
+
+    Question: {question}
+    """
+    return [
+        {"role": "system", "content": "You are a helpful assistant who answers questions about a document."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+async def answer_question_async(index, question, top_k=5, embedder=None):
+    """Answer a follow-up question from the top_k most relevant chunks.
+
+    Returns the answer and the chunks it was based on.
+    """
+    embedder = embedder or get_embedder()
+    query_vector = (await asyncio.to_thread(embedder.embed, [question]))[0]
+    results = index.search(query_vector, top_k)
+
+    client = clients.get_async_openai_client()
+    response = await client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=_follow_up_messages(question, results)
+    )
+    sources = [{"page": chunk.page, "chunk": chunk.index,
+                "score": round(score, 4), "text": chunk.text}
+               for chunk, score in results]
+    return response.choices[0].message.content, sources
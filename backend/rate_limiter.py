@@ -1,11 +1,264 @@
 from fastapi import Request, HTTPException
 from redis.asyncio import Redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
+import asyncio
 import os
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Request counters live for 48 hours so yesterday's count is still readable
+COUNTER_TTL = 60 * 60 * 48
+
+# Usage history ranges (in days) offered by the usage stats endpoint; daily
+# usage counters are kept long enough to cover the longest one
+USAGE_RANGES = (7, 30, 90, 365)
+USAGE_TTL = 60 * 60 * 24 * (max(USAGE_RANGES) + 1)
+# Limits, counts and usage history are weighted costs, not request counts.
+# The response fields keep their old "requests" names for the frontend.
+USAGE_UNIT = "cost_units"
+
+# Reads the tier, applies the tier's burst policy and daily limit, and
+# records the request's cost in a single atomic round trip, so concurrent
+# requests cannot overshoot either limit.
+# KEYS: requests counter, usage counter, tier, sliding window log, token bucket,
+#       cost breakdown hash
+# ARGV: counter ttl, usage ttl, default tier, cost, endpoint, then per tier:
+#       name, daily limit, burst algorithm, and two algorithm parameters
+#       (see _policy_args)
+# Returns {allowed (0/1), tier, daily limit, daily units used, retry after in ms}
+CHECK_RATE_LIMIT_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local tier = redis.call('GET', KEYS[3])
+local found, default
+for i = 6, #ARGV, 5 do
+    if ARGV[i] == tier then
+        found = i
+    end
+    if ARGV[i] == ARGV[3] then
+        default = i
+    end
+end
+if not found then
+    tier, found = ARGV[3], default
+end
+local limit = tonumber(ARGV[found + 1])
+local algorithm = ARGV[found + 2]
+local p1 = tonumber(ARGV[found + 3])
+local p2 = tonumber(ARGV[found + 4])
+
+local cost = tonumber(ARGV[4])
+local count = tonumber(redis.call('GET', KEYS[1]) or '0')
+if count + cost > limit then
+    return {0, tier, limit, count, 0}
+end
+
+if algorithm == 'sliding_window' then
+    -- At most p1 requests in any p2 milliseconds
+    redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', now - p2)
+    if redis.call('ZCARD', KEYS[4]) >= p1 then
+        local oldest = redis.call('ZRANGE', KEYS[4], 0, 0, 'WITHSCORES')
+        return {0, tier, limit, count, math.max(tonumber(oldest[2]) + p2 - now, 1)}
+    end
+elseif algorithm == 'token_bucket' then
+    -- Bursts of up to p1 requests, refilled with one token every p2 milliseconds
+    local bucket = redis.call('HMGET', KEYS[5], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or p1
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(p1, tokens + math.max(now - updated, 0) / p2)
+    if tokens < 1 then
+        return {0, tier, limit, count, math.ceil((1 - tokens) * p2)}
+    end
+    redis.call('HSET', KEYS[5], 'tokens', tostring(tokens - 1), 'updated', now)
+    redis.call('PEXPIRE', KEYS[5], math.ceil(p1 * p2))
+end
+
+count = redis.call('INCRBY', KEYS[1], cost)
+redis.call('INCRBY', KEYS[2], cost)
+redis.call('HINCRBY', KEYS[6], ARGV[5], cost)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[6], ARGV[2])
+if algorithm == 'sliding_window' then
+    redis.call('ZADD', KEYS[4], now, now .. ':' .. count)
+    redis.call('PEXPIRE', KEYS[4], p2)
+end
+return {1, tier, limit, count, 0}
+"""
+
+# Charges a document's size-based cost unless the user was already charged
+# for the same content today, so analysing a document and then narrating it
+# pays for its length once.
+# KEYS: charged documents set, requests counter, usage counter, cost breakdown hash
+# ARGV: content hash, cost, endpoint, counter ttl, usage ttl
+# Returns 1 if the cost was charged, 0 if it had already been
+CHARGE_DOCUMENT_SCRIPT = """
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('INCRBY', KEYS[2], ARGV[2])
+redis.call('INCRBY', KEYS[3], ARGV[2])
+redis.call('HINCRBY', KEYS[4], ARGV[3], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+redis.call('EXPIRE', KEYS[4], ARGV[5])
+return 1
+"""
+
+TIER_CACHE_SIZE = int(os.getenv('TIER_CACHE_SIZE', 10000))
+
+
+class TierCache:
+    """The last tier seen for each user, least recently seen dropped first.
+
+    Nothing on the request path reads tiers from here: the rate limit
+    script reads the tier in Redis. It only feeds the local limits used
+    while Redis is unreachable, so paying users keep their limits during an
+    outage. Entries are refreshed whenever a tier is read from Redis.
+    """
+
+    def __init__(self, max_size: int = TIER_CACHE_SIZE):
+        self.max_size = max_size
+        self._last_known = OrderedDict()
+
+    def remember(self, user_id: str, tier: str):
+        """Record the latest tier read for a user, for use while offline."""
+        self._last_known[user_id] = tier
+        self._last_known.move_to_end(user_id)
+        while len(self._last_known) > self.max_size:
+            self._last_known.popitem(last=False)
+
+    def last_known(self, user_id: str):
+        return self._last_known.get(user_id)
+
+
+# Fail fast when Redis is unreachable instead of stalling every request
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 1.0))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 0.5))
+REDIS_BREAKER_FAILURES = int(os.getenv('REDIS_BREAKER_FAILURES', 3))
+REDIS_BREAKER_RESET = float(os.getenv('REDIS_BREAKER_RESET', 15))
+
+# Errors that mean Redis itself is unavailable
+REDIS_ERRORS = (RedisConnectionError, RedisTimeoutError, OSError, asyncio.TimeoutError)
+
+
+class CircuitBreaker:
+    """Stops sending commands to Redis after repeated connection failures.
+
+    The breaker opens after failure_threshold consecutive failures and stays
+    open until a background probe (see RateLimiter._probe_redis) succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = REDIS_BREAKER_FAILURES,
+                 reset_timeout: float = REDIS_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.is_open = False
+
+    def allow(self) -> bool:
+        return not self.is_open
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self) -> bool:
+        """Count a failure, returning True if it opened the breaker."""
+        self.failures += 1
+        if not self.is_open and self.failures >= self.failure_threshold:
+            self.is_open = True
+            return True
+        return False
+
+    def close(self):
+        self.failures = 0
+        self.is_open = False
+
+
+class LocalRateLimiter:
+    """Approximate in-memory limits used while Redis is unreachable.
+
+    Only this process's requests are counted, so the effective limit across
+    workers is looser than the Redis one, but traffic to the LLM backends
+    stays bounded during an outage.
+    """
+
+    def __init__(self, max_users: int = 10000):
+        self.max_users = max_users
+        self._daily = OrderedDict()
+        self._bursts = OrderedDict()
+        self._charged = OrderedDict()
+
+    def _remember(self, entries, user_id, value):
+        entries[user_id] = value
+        entries.move_to_end(user_id)
+        while len(entries) > self.max_users:
+            entries.popitem(last=False)
+
+    def _check_burst(self, user_id: str, policy: dict, now: float) -> float:
+        """Apply a burst policy, returning seconds to wait (0 if allowed)."""
+        algorithm = policy.get('algorithm')
+        if algorithm == 'sliding_window':
+            window = self._bursts.get(user_id)
+            if not isinstance(window, deque):
+                window = deque()
+            while window and window[0] <= now - policy['window']:
+                window.popleft()
+            if len(window) >= policy['limit']:
+                return window[0] + policy['window'] - now
+            window.append(now)
+            self._remember(self._bursts, user_id, window)
+        elif algorithm == 'token_bucket':
+            bucket = self._bursts.get(user_id)
+            tokens, updated = bucket if isinstance(bucket, tuple) else (policy['capacity'], now)
+            tokens = min(policy['capacity'], tokens + (now - updated) * policy['refill_rate'])
+            if tokens < 1:
+                return (1 - tokens) / policy['refill_rate']
+            self._remember(self._bursts, user_id, (tokens - 1, now))
+        return 0
+
+    def count(self, user_id: str) -> int:
+        today = datetime.now().strftime('%Y-%m-%d')
+        date, count = self._daily.get(user_id, (today, 0))
+        return count if date == today else 0
+
+    def charge(self, user_id: str, cost: int) -> int:
+        count = self.count(user_id) + cost
+        self._remember(self._daily, user_id, (datetime.now().strftime('%Y-%m-%d'), count))
+        return count
+
+    def charge_document(self, user_id: str, content_hash: str, cost: int) -> bool:
+        """Charge cost unless this document was already charged today."""
+        today = datetime.now().strftime('%Y-%m-%d')
+        date, charged = self._charged.get(user_id, (today, set()))
+        if date != today:
+            charged = set()
+        if content_hash in charged:
+            return False
+        charged.add(content_hash)
+        self._remember(self._charged, user_id, (today, charged))
+        self.charge(user_id, cost)
+        return True
+
+    def check(self, user_id: str, limit: int, policy: dict, cost: int = 1):
+        """Return (allowed, count, retry_after_ms) like the Redis script."""
+        count = self.count(user_id)
+        if count + cost > limit:
+            return False, count, 0
+        retry_after = self._check_burst(user_id, policy or {}, time.monotonic())
+        if retry_after:
+            return False, count, max(int(retry_after * 1000), 1)
+        return True, self.charge(user_id, cost), 0
+
+
 class RateLimiter:
     def __init__(self):
         # Set up more detailed logging
@@ -26,7 +279,11 @@ class RateLimiter:
                 username=redis_user,
                 password=redis_password,
                 db=0,
-                decode_responses=True
+                decode_responses=True,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                # One quick retry; the circuit breaker handles longer outages
+                retry=Retry(ExponentialBackoff(cap=0.1, base=0.02), 1)
             )
             logger.debug("Redis connection initialized")
         except Exception as e:
@@ -34,53 +291,182 @@ class RateLimiter:
             # Create a dummy implementation for development/testing
             self.redis = None
             
-        # Define rate limit tiers (requests per day)
+        # Define rate limit tiers (cost units per day, see endpoint_costs).
+        # A frontend analysis is generate-qna plus generate-audio, 8 units,
+        # so these allow as many analyses a day as the old per-request
+        # limits of 50, 200 and 1000 did (two requests each).
         self.rate_limit_tiers = {
-            'free': 50,
-            'basic': 200,
-            'premium': 1000
+            'free': 200,
+            'basic': 800,
+            'premium': 4000
         }
 
+        # Short-term burst limits applied on top of the daily quota, so a
+        # day's requests cannot all be spent in one burst of parallel calls.
+        #   sliding_window: at most 'limit' requests in any 'window' seconds
+        #   token_bucket:   bursts of 'capacity', refilled at 'refill_rate'/s
+        # A tier without a policy only has the daily limit.
+        self.burst_policies = {
+            'free': {'algorithm': 'sliding_window', 'limit': 5, 'window': 60},
+            'basic': {'algorithm': 'token_bucket', 'capacity': 10, 'refill_rate': 0.2},
+            'premium': {'algorithm': 'token_bucket', 'capacity': 20, 'refill_rate': 1.0}
+        }
+
+        # Daily limits are in cost units. Each endpoint costs a number of
+        # units up front, and a processed document is charged one more unit
+        # per 'pages_per_unit' pages beyond the first ones, once per day.
+        self.endpoint_costs = {
+            '/api/generate-qna': 5,
+            '/api/generate-qna/stream': 5,
+            '/api/generate-audio': 3,
+            '/api/generate-audio/stream': 3,
+            '/api/ask': 1,
+            '/api/search': 1
+        }
+        self.pages_per_unit = 10
+
+        # Last known tiers, for the local limits while Redis is down
+        self.tier_cache = TierCache()
+
+        # Limits are enforced per process while Redis is unreachable
+        self.breaker = CircuitBreaker()
+        self.local_limiter = LocalRateLimiter()
+        self._probe = None
+
+        # redis-py runs registered scripts with EVALSHA, loading them on a miss
+        self._check_script = (self.redis.register_script(CHECK_RATE_LIMIT_SCRIPT)
+                              if self.redis else None)
+        self._charge_script = (self.redis.register_script(CHARGE_DOCUMENT_SCRIPT)
+                               if self.redis else None)
+
+    def _policy_args(self, tier: str) -> list:
+        """Encode a tier's burst policy as (algorithm, p1, p2) script arguments."""
+        policy = self.burst_policies.get(tier) or {}
+        algorithm = policy.get('algorithm', 'none')
+        if algorithm == 'sliding_window':
+            return [algorithm, policy['limit'], int(policy['window'] * 1000)]
+        if algorithm == 'token_bucket':
+            return [algorithm, policy['capacity'], 1000 / policy['refill_rate']]
+        return ['none', 0, 0]
+
+    def redis_available(self) -> bool:
+        """Whether Redis is configured and the circuit breaker lets commands
+        through. Other users of the connection check this first, and report
+        errors to record_redis_failure."""
+        return bool(self.redis) and self.breaker.allow()
+
+    def record_redis_failure(self, error: Exception):
+        """Count a Redis failure and start probing once the breaker opens.
+        Errors that don't mean Redis is unreachable are ignored."""
+        if not isinstance(error, REDIS_ERRORS):
+            return
+        if self.breaker.record_failure():
+            logger.error(f"Redis unreachable ({str(error)}), using local rate limits")
+            self._probe = asyncio.get_running_loop().create_task(self._probe_redis())
+
+    async def _probe_redis(self):
+        """Ping Redis in the background until it answers, then close the breaker."""
+        while True:
+            await asyncio.sleep(self.breaker.reset_timeout)
+            try:
+                await self.redis.ping()
+            except Exception as e:
+                logger.debug(f"Redis still unreachable: {str(e)}")
+                continue
+            self.breaker.close()
+            logger.info("Redis reachable again, resuming shared rate limits")
+            return
+
+    def _known_tier(self, user_id: str) -> str:
+        """The user's tier from in-process state, for use without Redis."""
+        return self.tier_cache.last_known(user_id) or 'free'
+
+    def _local_usage(self, user_id: str):
+        """(tier, limit, count today) from in-process state."""
+        tier = self._known_tier(user_id)
+        limit = self.rate_limit_tiers.get(tier, self.rate_limit_tiers['free'])
+        return tier, limit, self.local_limiter.count(user_id)
+
+    def _check_local(self, user_id: str, cost: int = 1):
+        """Rate limit against in-memory counters, shaped like the script result."""
+        tier, limit, _ = self._local_usage(user_id)
+        allowed, count, retry_after_ms = self.local_limiter.check(
+            user_id, limit, self.burst_policies.get(tier), cost)
+        return int(allowed), tier, limit, count, retry_after_ms
+
     async def get_user_tier(self, user_id: str) -> str:
         """Get the user's subscription tier."""
         if not self.redis:
             logger.warning("Redis not available, returning default tier")
             return 'free'
             
+        if not self.breaker.allow():
+            return self._known_tier(user_id)
+
         try:
             tier = await self.redis.get(f"user:{user_id}:tier")
             logger.debug(f"User {user_id} tier: {tier or 'free (default)'}")
-            return tier if tier else 'free'
+            tier = tier if tier else 'free'
+            self.tier_cache.remember(user_id, tier)
+            return tier
         except Exception as e:
             logger.error(f"Error getting user tier: {str(e)}")
+            self.record_redis_failure(e)
             return 'free'
 
-    async def get_remaining_requests(self, user_id: str) -> int:
-        """Get remaining requests for the user."""
+    async def get_remaining_requests(self, user_id: str):
+        """Get the user's tier and the cost units they have left today."""
         if not self.redis:
             logger.warning("Redis not available, returning default limit")
-            return self.rate_limit_tiers['free']
+            return self.rate_limit_tiers['free'], 'free'
+
+        if not self.breaker.allow():
+            tier, limit, count = self._local_usage(user_id)
+            return max(limit - count, 0), tier
             
         try:
             today = datetime.now().strftime('%Y-%m-%d')
             requests_key = f"user:{user_id}:requests:{today}"
+
+            # Current request count and tier in one round trip
+            count, tier = await self.redis.mget(requests_key, f"user:{user_id}:tier")
+            current_requests = int(count or 0)
+            tier = tier if tier in self.rate_limit_tiers else 'free'
+            self.tier_cache.remember(user_id, tier)
+            max_requests = self.rate_limit_tiers[tier]
             
-            # Get current request count
-            current_requests = int(await self.redis.get(requests_key) or 0)
-            
-            # Get user's tier and max requests
-            tier = await self.get_user_tier(user_id)
-            max_requests = self.rate_limit_tiers.get(tier, self.rate_limit_tiers['free'])
-            
-            remaining = max_requests - current_requests
+            # A document charge can take usage past the limit
+            remaining = max(max_requests - current_requests, 0)
             logger.debug(f"User {user_id} remaining requests: {remaining} (used: {current_requests}, max: {max_requests})")
-            return remaining
+            return remaining, tier
         except Exception as e:
             logger.error(f"Error getting remaining requests: {str(e)}")
-            return self.rate_limit_tiers['free']
+            self.record_redis_failure(e)
+            return self.rate_limit_tiers['free'], 'free'
+
+    def endpoint_cost(self, path: str) -> int:
+        return self.endpoint_costs.get(path.rstrip('/') or '/', 1)
+
+    def document_cost(self, pages: int) -> int:
+        """Extra units charged for processing a document of the given length."""
+        return max(pages - 1, 0) // self.pages_per_unit
+
+    async def _check_redis(self, user_id: str, cost: int, endpoint: str):
+        """Run the rate limit script for a user."""
+        today = datetime.now().strftime('%Y-%m-%d')
+        args = [COUNTER_TTL, USAGE_TTL, 'free', cost, endpoint]
+        for tier, limit in self.rate_limit_tiers.items():
+            args.extend([tier, limit, *self._policy_args(tier)])
+        return await self._check_script(
+            keys=[f"user:{user_id}:requests:{today}", f"user:{user_id}:usage:{today}",
+                  f"user:{user_id}:tier", f"user:{user_id}:window", f"user:{user_id}:bucket",
+                  f"user:{user_id}:costs:{today}"],
+            args=args
+        )
 
-    async def check_rate_limit(self, request: Request, token: dict, is_internal: bool = False):
-        """Middleware to check rate limits."""
+    async def check_rate_limit(self, request: Request, token: dict, is_internal: bool = False,
+                               cost: int = None):
+        """Middleware to check rate limits and charge the endpoint's cost."""
         if not self.redis:
             logger.warning("Redis not available, skipping rate limit check")
             return
@@ -99,19 +485,38 @@ class RateLimiter:
                 logger.error("Missing user ID in token")
                 raise HTTPException(status_code=401, detail="Invalid authentication token")
                 
-            today = datetime.now().strftime('%Y-%m-%d')
-            requests_key = f"user:{user_id}:requests:{today}"
-            usage_key = f"user:{user_id}:usage:{today}"
+            endpoint = request.url.path
+            if cost is None:
+                cost = self.endpoint_cost(endpoint)
+            if self.breaker.allow():
+                try:
+                    result = await self._check_redis(user_id, cost, endpoint)
+                    self.breaker.record_success()
+                    self.tier_cache.remember(user_id, result[1])
+                except REDIS_ERRORS as e:
+                    self.record_redis_failure(e)
+                    result = self._check_local(user_id, cost)
+            else:
+                result = self._check_local(user_id, cost)
+            allowed, tier, max_requests, current_requests, retry_after_ms = result
+            remaining = max(max_requests - current_requests, 0)
+            logger.debug(f"Request count for user {user_id}: {current_requests}/{max_requests} ({tier})")
 
-            # Get current request count
-            current_requests = int(await self.redis.get(requests_key) or 0)
-            logger.debug(f"Current request count for user {user_id}: {current_requests}")
-            
-            # Get user's tier and max requests
-            tier = await self.get_user_tier(user_id)
-            max_requests = self.rate_limit_tiers.get(tier, self.rate_limit_tiers['free'])
-            
-            if current_requests >= max_requests:
+            if not allowed and retry_after_ms:
+                retry_after = -(-retry_after_ms // 1000)
+                logger.warning(f"Burst limit exceeded for user {user_id}, retry in {retry_after}s")
+                raise HTTPException(
+                    status_code=429,
+                    detail={
+                        "error": "Too many requests",
+                        "tier": tier,
+                        "limit": max_requests,
+                        "remaining": remaining,
+                        "retry_after": retry_after
+                    },
+                    headers={"Retry-After": str(retry_after)}
+                )
+            if not allowed:
                 logger.warning(f"Rate limit exceeded for user {user_id}")
                 raise HTTPException(
                     status_code=429,
@@ -119,27 +524,66 @@ class RateLimiter:
                         "error": "Rate limit exceeded",
                         "tier": tier,
                         "limit": max_requests,
+                        "remaining": 0,
                         "reset": "next day"
                     }
                 )
-            
-            # Increment request count and daily usage
-            await self.redis.incr(requests_key)
-            await self.redis.incr(usage_key)
-            logger.debug(f"Incremented request count for user {user_id} - New count: {current_requests + 1}")
-            
-            # Set expiry for counters (48 hours to be safe)
-            await self.redis.expire(requests_key, 60 * 60 * 48)
-            await self.redis.expire(usage_key, 60 * 60 * 48)
-            
+
+            return {"tier": tier, "limit": max_requests, "remaining": remaining, "cost": cost}
+
         except HTTPException:
             # Re-raise HTTP exceptions
             raise
         except Exception as e:
             logger.error(f"Error in check_rate_limit: {str(e)}")
-            # Don't block the request if Redis is down
+            # Don't block the request on unexpected errors
             return
 
+    async def charge_document(self, request: Request, token: dict, pages: int,
+                              content_hash: str, is_internal: bool = False):
+        """Charge the size-based cost of a document once its length is known.
+
+        Each document is charged at most once per user per day, however many
+        endpoints process it. The charge is applied even if it takes the
+        user past their limit, so it only affects later requests.
+        """
+        cost = self.document_cost(pages)
+        user_id = token.get('uid')
+        if not self.redis or is_internal or not cost or not user_id:
+            return
+
+        endpoint = request.url.path
+        if not self.breaker.allow():
+            self.local_limiter.charge_document(user_id, content_hash, cost)
+            return
+        try:
+            today = datetime.now().strftime('%Y-%m-%d')
+            charged = await self._charge_script(
+                keys=[f"user:{user_id}:documents:{today}",
+                      f"user:{user_id}:requests:{today}",
+                      f"user:{user_id}:usage:{today}",
+                      f"user:{user_id}:costs:{today}"],
+                args=[content_hash, cost, endpoint, COUNTER_TTL, USAGE_TTL])
+            self.breaker.record_success()
+            if charged:
+                logger.debug(f"Charged user {user_id} {cost} units for a {pages} page document")
+        except Exception as e:
+            logger.error(f"Error charging document cost: {str(e)}")
+            if isinstance(e, REDIS_ERRORS):
+                self.record_redis_failure(e)
+                self.local_limiter.charge_document(user_id, content_hash, cost)
+
+    @staticmethod
+    def _usage_dates(days: int) -> list:
+        """The last N dates, oldest first."""
+        today = datetime.now()
+        return [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days - 1, -1, -1)]
+
+    @staticmethod
+    def _daily_usage(dates: list, counts: list) -> list:
+        return [{"date": date, "requests": int(count)}
+                for date, count in zip(dates, counts) if count]
+
     async def get_daily_usage(self, user_id: str, days: int = 30) -> list:
         """Get daily usage for the past N days."""
         if not self.redis:
@@ -147,25 +591,72 @@ class RateLimiter:
             return []
             
         try:
-            daily_usage = []
-            today = datetime.now()
-            
-            for i in range(days):
-                date = (today - timedelta(days=i)).strftime("%Y-%m-%d")
-                usage_key = f"user:{user_id}:usage:{date}"
-                count = await self.redis.get(usage_key)
-                if count:
-                    daily_usage.append({
-                        "date": date,
-                        "requests": int(count)
-                    })
-            
+            dates = self._usage_dates(days)
+            counts = await self.redis.mget([f"user:{user_id}:usage:{date}" for date in dates])
+            daily_usage = self._daily_usage(dates, counts)
             logger.debug(f"Retrieved {len(daily_usage)} days of usage data for user {user_id}")
-            return sorted(daily_usage, key=lambda x: x["date"])
+            return daily_usage
         except Exception as e:
             logger.error(f"Error getting daily usage: {str(e)}")
             return []
 
+    def _local_usage_stats(self, user_id: str) -> dict:
+        tier, limit, count = self._local_usage(user_id)
+        return {"total_limit": limit, "used_requests": count,
+                "remaining_requests": max(limit - count, 0), "unit": USAGE_UNIT,
+                "daily_usage": [], "cost_breakdown": {}, "tier": tier}
+
+    async def get_usage_stats(self, user_id: str, days: int = 30) -> dict:
+        """Get the tier, today's units, N days of usage and the per-endpoint
+        cost breakdown in a single pipelined round trip."""
+        if not self.redis:
+            logger.warning("Redis not available, returning default usage stats")
+            limit = self.rate_limit_tiers['free']
+            return {"total_limit": limit, "used_requests": 0, "remaining_requests": limit,
+                    "unit": USAGE_UNIT, "daily_usage": [], "cost_breakdown": {}, "tier": 'free'}
+
+        if not self.breaker.allow():
+            return self._local_usage_stats(user_id)
+
+        dates = self._usage_dates(days)
+        today = datetime.now().strftime('%Y-%m-%d')
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.mget([f"user:{user_id}:tier", f"user:{user_id}:requests:{today}"]
+                          + [f"user:{user_id}:usage:{date}" for date in dates])
+                for date in dates:
+                    pipe.hgetall(f"user:{user_id}:costs:{date}")
+                (tier, count, *counts), *breakdowns = await pipe.execute()
+            self.breaker.record_success()
+        except REDIS_ERRORS as e:
+            logger.error(f"Error getting usage stats: {str(e)}")
+            self.record_redis_failure(e)
+            return self._local_usage_stats(user_id)
+
+        tier = tier if tier in self.rate_limit_tiers else 'free'
+        limit = self.rate_limit_tiers[tier]
+        current_requests = int(count or 0)
+
+        daily_usage = []
+        cost_breakdown = {}
+        for date, units, breakdown in zip(dates, counts, breakdowns):
+            if not units:
+                continue
+            breakdown = {endpoint: int(value) for endpoint, value in breakdown.items()}
+            for endpoint, value in breakdown.items():
+                cost_breakdown[endpoint] = cost_breakdown.get(endpoint, 0) + value
+            daily_usage.append({"date": date, "requests": int(units), "breakdown": breakdown})
+
+        return {
+            "total_limit": limit,
+            "used_requests": current_requests,
+            "remaining_requests": max(limit - current_requests, 0),
+            "unit": USAGE_UNIT,
+            "daily_usage": daily_usage,
+            "cost_breakdown": cost_breakdown,
+            "tier": tier
+        }
+
     async def set_user_tier(self, user_id: str, tier: str):
         """Set a user's subscription tier."""
         if not self.redis:
@@ -178,6 +669,7 @@ class RateLimiter:
                 raise ValueError(f"Invalid tier. Must be one of: {list(self.rate_limit_tiers.keys())}")
             
             await self.redis.set(f"user:{user_id}:tier", tier)
+            self.tier_cache.remember(user_id, tier)
             logger.info(f"Set user {user_id} tier to {tier}")
         except Exception as e:
             logger.error(f"Error setting user tier: {str(e)}")
@@ -185,6 +677,8 @@ class RateLimiter:
 
     async def close(self):
         """Close Redis connection."""
+        if self._probe is not None and not self._probe.done():
+            self._probe.cancel()
         if self.redis:
             try:
                 await self.redis.close()
@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException, Query, Request, Depends
 from typing import List
 from pydantic import BaseModel
 import os
-import aiohttp
+from clients import get_async_http_client
 from firebase_auth import verify_firebase_token
 from rate_limiter import rate_limiter
 
@@ -38,40 +38,40 @@ async def search(q: str = Query(..., min_length=1),
                 detail="Google Search API credentials not configured"
             )
 
-        async with aiohttp.ClientSession() as session:
-            params = {
-                'key': GOOGLE_API_KEY,
-                'cx': SEARCH_ENGINE_ID,
-                'q': q,
-                'num': 10
-            }
-            
-            async with session.get(
-                'https://www.googleapis.com/customsearch/v1',
-                params=params
-            ) as response:
-                if response.status != 200:
-                    error_detail = await response.text()
-                    raise HTTPException(
-                        status_code=response.status,
-                        detail=f"Google Search API error: {error_detail}"
-                    )
-                
-                data = await response.json()
-                
-                if 'items' not in data:
-                    return SearchResponse(results=[])
+        params = {
+            'key': GOOGLE_API_KEY,
+            'cx': SEARCH_ENGINE_ID,
+            'q': q,
+            'num': 10
+        }
 
-                results = [
-                    SearchResult(
-                        title=item.get('title', ''),
-                        link=item.get('link', ''),
-                        snippet=item.get('snippet', '')
-                    )
-                    for item in data['items']
-                ]
-                
-                return SearchResponse(results=results)
+        # Reuse the process wide connection pool rather than opening a new
+        # session (and TLS handshake) per search
+        response = await get_async_http_client().get(
+            'https://www.googleapis.com/customsearch/v1',
+            params=params
+        )
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Google Search API error: {response.text}"
+            )
+
+        data = response.json()
+
+        if 'items' not in data:
+            return SearchResponse(results=[])
+
+        results = [
+            SearchResult(
+                title=item.get('title', ''),
+                link=item.get('link', ''),
+                snippet=item.get('snippet', '')
+            )
+            for item in data['items']
+        ]
+
+        return SearchResponse(results=results)
 
     except Exception as e:
         raise HTTPException(
@@ -2,6 +2,7 @@ from transformers import pipeline
 import torch
 from google.cloud import storage
 import json
+from chunker import chunk_text
 
 
 def summarize(text):
@@ -17,14 +18,19 @@ def summarize(text):
         torch_dtype=torch.float16
     )
 
-    # Chunk the text
-    max_chunk_size = 1024
-    chunks = [text[i:i+max_chunk_size] for i in range(0, len(text), max_chunk_size)]
+    # Chunk the text on paragraph and sentence boundaries, counting tokens
+    # with the model's own tokenizer so no chunk is truncated (BART reads at
+    # most 1024 tokens including special tokens)
+    max_chunk_tokens = 1000
+    chunks = chunk_text(
+        text,
+        max_tokens=max_chunk_tokens,
+        count=lambda chunk: len(summarizer.tokenizer.encode(chunk, add_special_tokens=False)))
 
     summaries = []
     for chunk in chunks:
         summary = summarizer(
-                    chunk,
+                    chunk.text,
                     max_length=130,
                     min_length=30,
                     do_sample=False
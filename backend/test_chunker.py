@@ -0,0 +1,49 @@
+from chunker import chunk_text
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def paragraph(n, sentences=8, words=15):
+    return ' '.join(
+        ' '.join(f"p{n}s{s}w{w}" for w in range(words)).capitalize() + '.'
+        for s in range(sentences))
+
+
+def shared_text(first, second):
+    """The longest run of words at the end of first that starts second."""
+    first, second = first.split(), second.split()
+    for size in range(min(len(first), len(second)), 0, -1):
+        if first[-size:] == second[:size]:
+            return first[-size:]
+    return []
+
+
+def test_adjacent_chunks_overlap_inside_long_paragraphs():
+    # Paragraphs of ~120 words never fit a 50 word overlap whole
+    text = '\n\n'.join(paragraph(n) for n in range(12))
+    chunks = chunk_text(text, max_tokens=400, overlap_tokens=50, count=count_words)
+
+    assert len(chunks) > 2
+    for first, second in zip(chunks, chunks[1:]):
+        shared = shared_text(first.text, second.text)
+        assert 0 < len(shared) <= 50
+        assert second.tokens <= 400
+
+
+def test_overlap_falls_back_to_words():
+    # A single sentence longer than the overlap is carried by its last words
+    text = '\n\n'.join(' '.join(f"p{n}w{w}" for w in range(120)) for n in range(6))
+    chunks = chunk_text(text, max_tokens=300, overlap_tokens=20, count=count_words)
+
+    for first, second in zip(chunks, chunks[1:]):
+        assert 0 < len(shared_text(first.text, second.text)) <= 20
+
+
+def test_no_overlap_by_default():
+    text = '\n\n'.join(paragraph(n) for n in range(12))
+    chunks = chunk_text(text, max_tokens=400, count=count_words)
+
+    for first, second in zip(chunks, chunks[1:]):
+        assert not shared_text(first.text, second.text)
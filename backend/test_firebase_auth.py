@@ -0,0 +1,73 @@
+import asyncio
+import json
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt, JWTError
+
+import firebase_auth
+
+PROJECT_ID = "test-project"
+KID = "test-key"
+
+
+@pytest.fixture(scope="module")
+def private_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption())
+
+
+@pytest.fixture(autouse=True)
+def signing_keys(tmp_path, monkeypatch, private_key):
+    public = jwk.construct(private_key, 'RS256').public_key().to_dict()
+    path = tmp_path / "jwks.json"
+    path.write_text(json.dumps({"keys": [{**public, "kid": KID}]}))
+    monkeypatch.setattr(firebase_auth, "public_keys", firebase_auth.PublicKeySet(path=str(path)))
+
+
+def make_token(private_key, **overrides):
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "sub": "user-1",
+        "iat": now - 10,
+        "auth_time": now - 60,
+        "exp": now + 3600,
+        **overrides
+    }
+    return jwt.encode(claims, private_key, algorithm='RS256', headers={"kid": KID})
+
+
+def verify(token):
+    return asyncio.run(firebase_auth.verify_id_token_locally(token, PROJECT_ID))
+
+
+def test_valid_token(private_key):
+    assert verify(make_token(private_key))["uid"] == "user-1"
+
+
+def test_future_issued_at_is_rejected(private_key):
+    with pytest.raises(JWTError, match="iat"):
+        verify(make_token(private_key, iat=int(time.time()) + 600))
+
+
+def test_future_auth_time_is_rejected(private_key):
+    with pytest.raises(JWTError, match="auth_time"):
+        verify(make_token(private_key, auth_time=int(time.time()) + 600))
+
+
+def test_missing_auth_time_is_rejected(private_key):
+    token = make_token(private_key)
+    claims = jwt.get_unverified_claims(token)
+    del claims["auth_time"]
+    with pytest.raises(JWTError, match="auth_time"):
+        verify(jwt.encode(claims, private_key, algorithm='RS256', headers={"kid": KID}))
+
+
+def test_clock_skew_leeway(private_key, monkeypatch):
+    monkeypatch.setattr(firebase_auth, "TOKEN_CLOCK_SKEW", 30)
+    assert verify(make_token(private_key, iat=int(time.time()) + 10))["uid"] == "user-1"
@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from rate_limiter import RateLimiter, CHECK_RATE_LIMIT_SCRIPT, CHARGE_DOCUMENT_SCRIPT
+
+TOKEN = {"uid": "user-1"}
+
+
+@pytest.fixture
+def limiter():
+    limiter = RateLimiter()
+    # The scripts run in fakeredis' Lua interpreter
+    limiter.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    limiter._check_script = limiter.redis.register_script(CHECK_RATE_LIMIT_SCRIPT)
+    limiter._charge_script = limiter.redis.register_script(CHARGE_DOCUMENT_SCRIPT)
+    return limiter
+
+
+def request(path):
+    return Request({"type": "http", "method": "POST", "path": path,
+                    "headers": [], "query_string": b""})
+
+
+async def rejection(limiter, path):
+    with pytest.raises(HTTPException) as raised:
+        await limiter.check_rate_limit(request(path), TOKEN)
+    assert raised.value.status_code == 429
+    return raised.value
+
+
+def test_daily_limit_counts_costs(limiter):
+    limiter.rate_limit_tiers['free'] = 12
+    limiter.burst_policies['free'] = None
+
+    async def run():
+        for _ in range(2):
+            await limiter.check_rate_limit(request('/api/generate-qna'), TOKEN)
+        # 10 of 12 units are used, another analysis costs 5
+        error = await rejection(limiter, '/api/generate-qna')
+        assert error.detail["error"] == "Rate limit exceeded"
+        assert not error.headers
+        # Cheaper endpoints still fit
+        result = await limiter.check_rate_limit(request('/api/ask'), TOKEN)
+        assert result["remaining"] == 1
+        assert await limiter.get_remaining_requests("user-1") == (1, 'free')
+
+    asyncio.run(run())
+
+
+def test_sliding_window_returns_retry_after(limiter):
+    async def run():
+        for _ in range(limiter.burst_policies['free']['limit']):
+            await limiter.check_rate_limit(request('/api/ask'), TOKEN)
+        error = await rejection(limiter, '/api/ask')
+        assert error.detail["error"] == "Too many requests"
+        assert 0 < int(error.headers["Retry-After"]) <= limiter.burst_policies['free']['window']
+        # Rejected requests are not charged
+        assert await limiter.get_remaining_requests("user-1") == (195, 'free')
+
+    asyncio.run(run())
+
+
+def test_token_bucket_refills(limiter):
+    limiter.burst_policies['premium'] = {'algorithm': 'token_bucket', 'capacity': 2,
+                                         'refill_rate': 20}
+
+    async def run():
+        await limiter.set_user_tier("user-1", 'premium')
+        for _ in range(2):
+            await limiter.check_rate_limit(request('/api/ask'), TOKEN)
+        error = await rejection(limiter, '/api/ask')
+        assert error.headers["Retry-After"] == "1"
+        # One token is back after 1/20 s
+        time.sleep(0.1)
+        result = await limiter.check_rate_limit(request('/api/ask'), TOKEN)
+        assert result["tier"] == 'premium'
+
+    asyncio.run(run())
+
+
+def test_document_charged_once_per_day(limiter):
+    async def run():
+        await limiter.check_rate_limit(request('/api/generate-qna'), TOKEN)
+        # 35 pages cost 3 extra units, whichever endpoint processes them
+        await limiter.charge_document(request('/api/generate-qna'), TOKEN, 35, "hash-a")
+        await limiter.charge_document(request('/api/generate-audio'), TOKEN, 35, "hash-a")
+        assert await limiter.get_remaining_requests("user-1") == (192, 'free')
+        await limiter.charge_document(request('/api/generate-audio'), TOKEN, 35, "hash-b")
+        assert await limiter.get_remaining_requests("user-1") == (189, 'free')
+
+    asyncio.run(run())
+
+
+def test_usage_stats_break_down_costs(limiter):
+    async def run():
+        await limiter.check_rate_limit(request('/api/generate-qna'), TOKEN)
+        await limiter.check_rate_limit(request('/api/ask'), TOKEN)
+        await limiter.check_rate_limit(request('/api/ask'), TOKEN)
+        await limiter.charge_document(request('/api/generate-qna'), TOKEN, 35, "hash-a")
+        return await limiter.get_usage_stats("user-1", 7)
+
+    stats = asyncio.run(run())
+    assert stats["tier"] == 'free'
+    assert stats["unit"] == "cost_units"
+    assert stats["used_requests"] == 10
+    assert stats["remaining_requests"] == 190
+    assert stats["cost_breakdown"] == {'/api/generate-qna': 8, '/api/ask': 2}
+    [today] = stats["daily_usage"]
+    assert today["requests"] == 10
+    assert today["breakdown"] == stats["cost_breakdown"]
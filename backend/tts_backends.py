@@ -0,0 +1,223 @@
+import logging
+import math
+import os
+import shutil
+import subprocess
+import time
+
+from botocore.exceptions import ClientError
+
+import mp3
+from clients import get_polly_client
+
+logger = logging.getLogger(__name__)
+
+POLLY_VOICE = os.getenv("POLLY_VOICE", "Brian")
+POLLY_ENGINE = os.getenv("POLLY_ENGINE", "neural")
+# Polly accepts up to 3000 billed characters per request
+POLLY_MAX_CHARS = int(os.getenv("POLLY_MAX_CHARS", 2800))
+# After Polly throttles us, send new narrations to the fallback for this long
+TTS_THROTTLE_COOLDOWN = int(os.getenv("TTS_THROTTLE_COOLDOWN", 60))
+ESPEAK_VOICE = os.getenv("ESPEAK_VOICE", "en-us")
+
+THROTTLING_ERRORS = {'ThrottlingException', 'TooManyRequestsException'}
+
+# Silent MPEG1 Layer III frame: 128 kbps, 44.1 kHz, joint stereo, no CRC.
+# 1152 samples long, its all zero side info and main data decode to silence.
+SILENT_FRAME = b'\xff\xfb\x90\x64' + bytes(413)
+FRAME_SECONDS = 1152 / 44100
+
+
+class ThrottledError(Exception):
+    """The TTS service is rate limiting us and retrying did not help."""
+
+
+def _error_code(error):
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code')
+    return None
+
+
+def speech_seconds(text: str, words_per_minute: int = 165) -> float:
+    """Roughly how long text takes to read aloud."""
+    return len(text.split()) * 60 / words_per_minute
+
+
+def silent_mp3(seconds: float) -> bytes:
+    """MP3 frames of silence lasting seconds."""
+    return SILENT_FRAME * max(1, round(seconds / FRAME_SECONDS))
+
+
+class TTSBackend:
+    """Turns text into MP3 audio.
+
+    Subclasses implement synthesize() for pieces of at most max_chars
+    characters and return bare MP3 frames, without ID3 tags or Xing
+    headers, so that the pieces can be concatenated. voice and engine
+    identify the sound of the audio in cache keys.
+    """
+
+    name = "tts"
+    voice = ""
+    engine = ""
+    max_chars = 2800
+
+    def synthesize(self, text: str) -> bytes:
+        raise NotImplementedError
+
+    def stream(self, text: str, chunk_size: int = 8192):
+        """Yield the audio of text in chunks as it becomes available."""
+        audio = self.synthesize(text)
+        for start in range(0, len(audio), chunk_size):
+            yield audio[start:start + chunk_size]
+
+    def available(self) -> bool:
+        return True
+
+
+class PollyBackend(TTSBackend):
+    """Amazon Polly. Retries are left to the client's adaptive retry mode
+    (see clients.get_polly_client), so throttling is never retried twice."""
+
+    def __init__(self, voice=POLLY_VOICE, engine=POLLY_ENGINE):
+        self.name = f"polly:{engine}:{voice}"
+        self.voice = voice
+        self.engine = engine
+        self.max_chars = POLLY_MAX_CHARS
+        self.throttled_until = 0.0
+
+    def _request(self, text):
+        try:
+            return get_polly_client().synthesize_speech(
+                Text=text,
+                OutputFormat='mp3',
+                VoiceId=self.voice,
+                Engine=self.engine
+            )
+        except ClientError as e:
+            # The client has already retried with adaptive backoff
+            if _error_code(e) in THROTTLING_ERRORS:
+                self.throttled_until = time.time() + TTS_THROTTLE_COOLDOWN
+                raise ThrottledError(str(e)) from e
+            raise
+
+    def synthesize(self, text):
+        with self._request(text)['AudioStream'] as stream:
+            return mp3.strip_metadata(stream.read())
+
+    def stream(self, text, chunk_size=8192):
+        with self._request(text)['AudioStream'] as stream:
+            yield from mp3.strip_stream_metadata(stream.iter_chunks(chunk_size))
+
+    def available(self):
+        return time.time() >= self.throttled_until
+
+
+class EspeakBackend(TTSBackend):
+    """Offline synthesis on the CPU with espeak-ng, encoded to MP3 by lame."""
+
+    def __init__(self, voice=ESPEAK_VOICE):
+        self.espeak = shutil.which("espeak-ng") or shutil.which("espeak")
+        self.lame = shutil.which("lame")
+        if not self.espeak or not self.lame:
+            raise RuntimeError("espeak-ng and lame must be installed for local TTS")
+        self.name = f"espeak:{voice}"
+        self.voice = voice
+        self.engine = "espeak"
+        self.max_chars = 10000
+
+    def synthesize(self, text):
+        speech = subprocess.run([self.espeak, "-v", self.voice, "--stdout"],
+                                input=text.encode('utf-8'), capture_output=True, check=True)
+        encoded = subprocess.run([self.lame, "--quiet", "-b", "64", "-", "-"],
+                                 input=speech.stdout, capture_output=True, check=True)
+        return mp3.strip_metadata(encoded.stdout)
+
+
+class FakeTTSBackend(TTSBackend):
+    """Deterministic stand-in for load tests and offline profiling.
+
+    Produces silent MP3 as long as the text would take to read, after a
+    delay shaped like Polly's: a fixed time to first byte plus a time per
+    character, delivered in frames over the remaining time when streamed.
+    """
+
+    def __init__(self, latency=0.15, seconds_per_char=0.0002, max_chars=POLLY_MAX_CHARS):
+        self.name = "fake"
+        self.voice = "silence"
+        self.engine = "fake"
+        self.latency = latency
+        self.seconds_per_char = seconds_per_char
+        self.max_chars = max_chars
+
+    def synthesize(self, text):
+        time.sleep(self.latency + self.seconds_per_char * len(text))
+        return silent_mp3(speech_seconds(text))
+
+    def stream(self, text, chunk_size=8192):
+        time.sleep(self.latency)
+        audio = silent_mp3(speech_seconds(text))
+        chunks = max(1, math.ceil(len(audio) / chunk_size))
+        for start in range(0, len(audio), chunk_size):
+            time.sleep(self.seconds_per_char * len(text) / chunks)
+            yield audio[start:start + chunk_size]
+
+
+BACKENDS = {
+    "polly": PollyBackend,
+    "espeak": EspeakBackend,
+    "fake": FakeTTSBackend,
+}
+
+_backends = {}
+
+
+def _create_backend(kind):
+    """Create a backend, raising if it cannot run here (e.g. espeak-ng or
+    lame is not installed)."""
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown TTS backend '{kind}', expected one of {sorted(BACKENDS)}")
+    if kind not in _backends:
+        _backends[kind] = BACKENDS[kind]()
+        logger.info(f"Using TTS backend {_backends[kind].name}")
+    return _backends[kind]
+
+
+def get_tts_backend() -> TTSBackend:
+    """The backend selected by the TTS_BACKEND environment variable
+    ('polly', 'espeak' or 'fake')."""
+    return _create_backend(os.getenv("TTS_BACKEND", "polly"))
+
+
+# Fallbacks that cannot be used, with the reason
+_fallback_errors = {}
+
+
+def get_fallback_backend():
+    """The backend named by TTS_FALLBACK to use while the primary one is
+    throttled, or None if no usable fallback is configured."""
+    kind = os.getenv("TTS_FALLBACK", "")
+    if not kind or kind == os.getenv("TTS_BACKEND", "polly"):
+        return None
+    if kind not in _fallback_errors:
+        if kind == "fake" and os.getenv("ENVIRONMENT") == "production":
+            # Silent audio must never reach real users, or the audio cache
+            error = "the fake TTS backend is not allowed in production"
+        else:
+            try:
+                return _create_backend(kind)
+            except RuntimeError as e:
+                error = str(e)
+        _fallback_errors[kind] = error
+        logger.error(f"TTS fallback '{kind}' disabled: {error}")
+    return None
+
+
+def active_backend() -> TTSBackend:
+    """The primary backend, or the fallback while the primary is throttled."""
+    backend = get_tts_backend()
+    if not backend.available():
+        fallback = get_fallback_backend()
+        if fallback:
+            return fallback
+    return backend
@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import os
+import re
+
+import numpy as np
+
+from clients import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+class Embedder:
+    """Turns texts into fixed size vectors.
+
+    Subclasses implement _embed; embed() normalizes the rows so that a dot
+    product between vectors is their cosine similarity.
+    """
+
+    name = "embedder"
+    dim = 0
+
+    def _embed(self, texts):
+        raise NotImplementedError
+
+    def embed(self, texts) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        vectors = np.asarray(self._embed(list(texts)), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class OpenAIEmbedder(Embedder):
+    """Embeddings from the OpenAI API."""
+
+    def __init__(self, model="text-embedding-3-small", dim=1536, batch_size=256):
+        self.name = f"openai:{model}"
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+
+    def _embed(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = get_openai_client().embeddings.create(
+                model=self.model,
+                input=texts[start:start + self.batch_size])
+            vectors.extend(item.embedding for item in response.data)
+        return vectors
+
+
+class LocalEmbedder(Embedder):
+    """Embeddings from a sentence-transformers model running on the CPU."""
+
+    def __init__(self, model="sentence-transformers/all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+        self.name = f"local:{model}"
+        self.model = SentenceTransformer(model, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def _embed(self, texts):
+        return self.model.encode(texts, batch_size=32, show_progress_bar=False)
+
+
+class HashingEmbedder(Embedder):
+    """Dependency free bag-of-words embeddings using the hashing trick.
+
+    Much weaker than a learned model, but deterministic and offline, which
+    makes it useful for tests. Only used when EMBEDDER=hashing.
+    """
+
+    def __init__(self, dim=512):
+        self.name = f"hashing:{dim}"
+        self.dim = dim
+
+    def _bucket(self, token):
+        digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'little')
+        return value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def _embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = TOKEN_RE.findall(text.lower())
+            # Unigrams plus bigrams to keep a little word order
+            for token in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                column, sign = self._bucket(token)
+                vectors[row, column] += sign
+        return vectors
+
+
+_embedder = None
+
+
+def get_embedder() -> Embedder:
+    """The process wide embedder selected by the EMBEDDER environment variable
+    ('openai', 'local' or 'hashing'), raising if it cannot run here."""
+    global _embedder
+    if _embedder is None:
+        kind = os.getenv("EMBEDDER", "openai")
+        if kind == "local":
+            try:
+                _embedder = LocalEmbedder(os.getenv("LOCAL_EMBEDDING_MODEL",
+                                                    "sentence-transformers/all-MiniLM-L6-v2"))
+            except ImportError as e:
+                # Never index with a weaker embedder than the one configured
+                raise RuntimeError("sentence-transformers must be installed for EMBEDDER=local") from e
+        elif kind == "hashing":
+            _embedder = HashingEmbedder()
+        else:
+            _embedder = OpenAIEmbedder(os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"))
+        logger.info(f"Using embedder {_embedder.name}")
+    return _embedder
+
+
+class VectorIndex:
+    """Exact nearest-neighbour search over normalized embeddings.
+
+    A single document yields at most a few thousand chunks, so a brute-force
+    matrix-vector product is both exact and faster than building an
+    approximate index.
+    """
+
+    def __init__(self, vectors: np.ndarray, chunks: list, embedder_name: str = ""):
+        if len(vectors) != len(chunks):
+            raise ValueError("Each chunk needs exactly one vector")
+        self.vectors = vectors
+        self.chunks = chunks
+        self.embedder_name = embedder_name
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query_vector: np.ndarray, top_k: int = 5) -> list:
+        """Return (chunk, score) pairs for the top_k most similar chunks."""
+        if len(self.chunks) == 0:
+            return []
+        scores = self.vectors @ np.asarray(query_vector, dtype=self.vectors.dtype).ravel()
+        top_k = min(top_k, len(scores))
+        # argpartition finds the top k in linear time, only those get sorted
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunks[i], float(scores[i])) for i in top]
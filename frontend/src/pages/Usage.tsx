@@ -82,9 +82,10 @@ const Usage = () => {
         
         setUsageData(data.daily_usage || []);
         setQuotaInfo({
-          total_limit: data.total_limit / 2 || 0,
-          used_requests: data.used_requests / 2 || 0,
-          remaining_requests: data.remaining_requests / 2 || 0,
+          // Limits and usage are in cost units (see the backend's endpoint_costs)
+          total_limit: data.total_limit || 0,
+          used_requests: data.used_requests || 0,
+          remaining_requests: data.remaining_requests || 0,
           tier: data.tier || 'standard'
         });
       } catch (err) {
@@ -170,17 +171,17 @@ const Usage = () => {
         
         <div className="grid gap-6 grid-cols-1 md:grid-cols-3 mb-6">
           <div className="bg-gray-800 rounded-lg p-6">
-            <h2 className="text-gray-400 text-lg mb-2">Total Limit</h2>
+            <h2 className="text-gray-400 text-lg mb-2">Daily Units</h2>
             <p className="text-3xl font-bold text-gray-200">{quotaInfo.total_limit.toLocaleString()}</p>
           </div>
 
           <div className="bg-gray-800 rounded-lg p-6">
-            <h2 className="text-gray-400 text-lg mb-2">Used Requests</h2>
+            <h2 className="text-gray-400 text-lg mb-2">Used Units</h2>
             <p className="text-3xl font-bold text-gray-200">{quotaInfo.used_requests.toLocaleString()}</p>
           </div>
 
           <div className="bg-gray-800 rounded-lg p-6">
-            <h2 className="text-gray-400 text-lg mb-2">Remaining Requests</h2>
+            <h2 className="text-gray-400 text-lg mb-2">Remaining Units</h2>
             <p className="text-3xl font-bold text-gray-200">{quotaInfo.remaining_requests.toLocaleString()}</p>
             <p className="text-sm text-gray-400 mt-2">Resets daily</p>
           </div>
@@ -191,7 +192,7 @@ const Usage = () => {
             <h2 className="text-gray-400 text-lg mb-4">Daily Usage</h2>
             <div className="h-80 w-full">
               <ResponsiveContainer width="100%" height="100%">
-                <LineChart data={usageData.map(item => ({ ...item, requests: item.requests / 2 }))}>
+                <LineChart data={usageData}>
                   <CartesianGrid strokeDasharray="3 3" stroke="#374151" />
                   <XAxis 
                     dataKey="date" 
@@ -201,7 +202,7 @@ const Usage = () => {
                   <YAxis stroke="#9CA3AF" />
                   <Tooltip 
                     labelFormatter={(date) => format(parseISO(date), 'MM/dd/yyyy')}
-                    formatter={(value) => [value, 'Requests']}
+                    formatter={(value) => [value, 'Units']}
                     contentStyle={{
                       backgroundColor: '#1F2937',
                       border: 'none',